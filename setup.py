@@ -46,5 +46,6 @@ setup(
     install_requires=requirements,
     python_requires='>=3.6',
     package_data={'skeletor': ['templates/*template*']},
+    entry_points={'console_scripts': ['skeletor = skeletor.cli:main']},
     zip_safe=False
 )
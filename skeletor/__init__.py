@@ -24,3 +24,7 @@ from .skeletonizers import skeletonize
 from .radiusextraction import radii
 from .preprocessing import simplify
 from .postprocessing import clean
+from .pipeline import batch
+
+from . import cache, profiling
+from .skeleton import Skeleton
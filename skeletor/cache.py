@@ -0,0 +1,179 @@
+#    This script is part of skeletor (http://www.github.com/schlegelp/skeletor).
+#    Copyright (C) 2018 Philipp Schlegel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.
+
+"""On-disk cache for contracted meshes.
+
+``contract`` accepts a ``cache`` (a directory or a ``ContractionCache``):
+contracted vertex positions are stored under a key derived from the input
+mesh's vertices and faces plus all parameters that affect the result and the
+skeletor version (so that upgrading invalidates old entries). Calling
+``contract`` again with the same mesh and parameters then simply loads the
+vertex positions from disk.
+
+Examples
+--------
+>>> import skeletor as sk
+>>> cont = sk.contract(mesh, cache='~/.skeletor_cache')   # doctest: +SKIP
+>>> # Second call loads the contracted vertices from the cache
+>>> cont = sk.contract(mesh, cache='~/.skeletor_cache')   # doctest: +SKIP
+
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import __version__
+
+__all__ = ['ContractionCache']
+
+
+class ContractionCache:
+    """Content-addressed cache for contracted vertex positions.
+
+    Each entry is a single ``.npy`` file named after its key. Entries are
+    loaded memory-mapped and written atomically, i.e. multiple processes can
+    safely share the same cache directory.
+
+    Parameters
+    ----------
+    path :      str
+                Directory to store the cache in. Will be created if it does
+                not exist.
+    max_size :  int | None
+                Max total size of the cache in bytes. If exceeded, the least
+                recently used entries are dropped. None means no limit.
+
+    """
+
+    def __init__(self, path, max_size=10 * 1024 ** 3):
+        self.path = os.path.abspath(os.path.expanduser(str(path)))
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def __repr__(self):
+        return f'<ContractionCache({self.path}, entries={len(self)})>'
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return os.path.isfile(self._file(key))
+
+    @property
+    def size(self):
+        """Total size of all entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def key(self, mesh, **params):
+        """Generate key from mesh, (contraction) parameters and version.
+
+        Parameters
+        ----------
+        mesh :      trimesh.Trimesh
+        **params
+                    Parameters that affect the result. Values can be anything
+                    with a stable ``repr`` or numpy arrays.
+
+        Returns
+        -------
+        str
+                    Hex digest.
+
+        """
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        for arr in (mesh.vertices, mesh.faces):
+            _update(h, arr)
+        for k in sorted(params):
+            h.update(k.encode())
+            if isinstance(params[k], np.ndarray):
+                _update(h, params[k])
+            else:
+                h.update(repr(params[k]).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """Load vertex positions (memory-mapped) or return None."""
+        try:
+            V = np.load(self._file(key), mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        # Mark as recently used
+        try:
+            os.utime(self._file(key))
+        except OSError:
+            pass
+        return V
+
+    def put(self, key, V):
+        """Store vertex positions and evict old entries if necessary."""
+        tmp = os.path.join(self.path, f'.{key}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(V))
+        os.replace(tmp, self._file(key))
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until cache fits ``max_size``."""
+        if self.max_size is None:
+            return
+        entries = sorted(self._entries(), key=lambda x: x[2])
+        total = sum(size for _, size, _ in entries)
+        for f, size, _ in entries:
+            if total <= self.max_size:
+                break
+            if keep and f == self._file(keep):
+                continue
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Drop all entries."""
+        for f, _, _ in self._entries():
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+    def _file(self, key):
+        return os.path.join(self.path, f'{key}.npy')
+
+    def _entries(self):
+        """Return (file, size, last used) for each entry."""
+        entries = []
+        for f in os.listdir(self.path):
+            if not f.endswith('.npy') or f.startswith('.'):
+                continue
+            f = os.path.join(self.path, f)
+            try:
+                st = os.stat(f)
+            except FileNotFoundError:
+                continue
+            entries.append((f, st.st_size, st.st_mtime))
+        return entries
+
+
+def _update(h, arr):
+    """Add array (including its dtype and shape) to hash."""
+    arr = np.ascontiguousarray(arr)
+    h.update(json.dumps([arr.dtype.str, arr.shape]).encode())
+    h.update(arr.data)
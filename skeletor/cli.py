@@ -0,0 +1,184 @@
+#    This script is part of skeletor (http://www.github.com/schlegelp/skeletor).
+#    Copyright (C) 2018 Philipp Schlegel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.
+
+"""Command line interface: skeletonize mesh files into SWC files.
+
+Examples
+--------
+Contract, skeletonize and add radii for all meshes in a directory using 8
+processes, skipping meshes that have already been skeletonized::
+
+    $ skeletor meshes/ -o swcs/ --sampling-dist 100 --radii --jobs 8 \\
+        --resume --log log.jsonl
+
+Parameters for the individual stages can be passed as ``KEY=VALUE``::
+
+    $ skeletor "meshes/*.ply" -o swcs/ --sampling-dist 100 \\
+        --contract-kw iter_lim=4 --contract-kw SL=10 --clean
+"""
+
+import argparse
+import ast
+import glob
+import json
+import os
+import sys
+import time
+
+from . import __version__
+from .pipeline import skeletonize_dir, MESH_EXTENSIONS
+
+
+def main(argv=None):
+    """Run command line interface. Returns exit code."""
+    args = _parser().parse_args(argv)
+
+    files = _expand(args.inputs, args.extensions)
+    if not files:
+        print('No mesh files found.', file=sys.stderr)
+        return 1
+
+    skeletonize_kws = {'method': args.method, **dict(args.skeletonize_kw)}
+    if args.sampling_dist is not None:
+        skeletonize_kws['sampling_dist'] = args.sampling_dist
+    if args.method == 'vertex_clusters' and 'sampling_dist' not in skeletonize_kws:
+        print('Method "vertex_clusters" requires --sampling-dist', file=sys.stderr)
+        return 2
+
+    contract_kws = False if args.no_contract else dict(args.contract_kw)
+    if contract_kws is not False and args.cache:
+        contract_kws['cache'] = args.cache
+    clean_kws = dict(args.clean_kw) if args.clean or args.clean_kw else None
+    radii_kws = dict(args.radii_kw) if args.radii or args.radii_kw else None
+
+    try:
+        results = skeletonize_dir(files, args.output,
+                                  skeletonize_kws=skeletonize_kws,
+                                  contract_kws=contract_kws,
+                                  clean_kws=clean_kws,
+                                  radii_kws=radii_kws,
+                                  skip_existing=args.resume,
+                                  prefetch=args.prefetch,
+                                  n_jobs=args.jobs,
+                                  memory=args.memory,
+                                  progress=not args.quiet)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    log = open(args.log, 'a') if args.log else None
+    n_failed = 0
+    try:
+        for res in results:
+            if res['error']:
+                n_failed += 1
+                if not args.quiet:
+                    print(f"Failed: {res['id']}\n{res['error']}", file=sys.stderr)
+            if log:
+                log.write(json.dumps({'file': str(res['id']),
+                                      'output': res['output'],
+                                      'ok': res['error'] is None,
+                                      'error': res['error'],
+                                      'timings': res['timings'],
+                                      'peak_mem': res['peak_mem'],
+                                      'max_rss': res['max_rss'],
+                                      'time': time.time()}) + '\n')
+                log.flush()
+    finally:
+        if log:
+            log.close()
+
+    return 1 if n_failed else 0
+
+
+def _parser():
+    """Generate argument parser."""
+    parser = argparse.ArgumentParser(
+        prog='skeletor',
+        description='Skeletonize meshes: contract -> skeletonize -> clean -> '
+                    'radii. Writes one SWC file per mesh.')
+    parser.add_argument('inputs', nargs='+',
+                        help='Mesh files, directories or glob patterns.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Directory to write SWC files to.')
+    parser.add_argument('--method', default='vertex_clusters',
+                        choices=['vertex_clusters', 'edge_collapse'],
+                        help='Skeletonization method (default: vertex_clusters).')
+    parser.add_argument('--sampling-dist', type=float,
+                        help='Sampling distance for vertex_clusters.')
+    parser.add_argument('--no-contract', action='store_true',
+                        help='Skip contraction (e.g. for contracted meshes).')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Cache contracted meshes in this directory.')
+    parser.add_argument('--clean', action='store_true',
+                        help='Clean up skeletons (requires ncollpyde).')
+    parser.add_argument('--radii', action='store_true',
+                        help='Add radii to skeletons.')
+    for st in ('contract', 'skeletonize', 'clean', 'radii'):
+        parser.add_argument(f'--{st}-kw', type=_key_value, action='append',
+                            default=[], metavar='KEY=VALUE',
+                            help=f'Parameter for `{st}`. Can be given '
+                                 'multiple times.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes. -1 for all cores (default: 1).')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip meshes with existing SWC files.')
+    parser.add_argument('--log', metavar='FILE',
+                        help='Append per-mesh timings and errors to this '
+                             'JSON-lines file.')
+    parser.add_argument('--memory', action='store_true',
+                        help='Trace peak memory per stage (slower).')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='Meshes to load ahead if --jobs is 1 (default: 2).')
+    parser.add_argument('--extensions', nargs='+', default=list(MESH_EXTENSIONS),
+                        help='File extensions to look for in directories.')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='No progress bar or error messages.')
+    parser.add_argument('--version', action='version',
+                        version=f'%(prog)s {__version__}')
+    return parser
+
+
+def _key_value(s):
+    """Parse "KEY=VALUE" into (key, value) tuple."""
+    if '=' not in s:
+        raise argparse.ArgumentTypeError(f'Expected KEY=VALUE, got "{s}"')
+    key, value = s.split('=', 1)
+    # Try interpreting the value as Python literal (numbers, None, etc.)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key.strip(), value
+
+
+def _expand(inputs, extensions):
+    """Turn files, directories and glob patterns into a list of files."""
+    extensions = tuple(e.lower() for e in extensions)
+    files = []
+    for i in inputs:
+        if os.path.isdir(i):
+            files += sorted(os.path.join(i, f) for f in os.listdir(i)
+                            if f.lower().endswith(extensions))
+        elif os.path.isfile(i):
+            files.append(i)
+        else:
+            files += sorted(glob.glob(i))
+    return files
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,17 +17,31 @@
 #    along with this program.
 
 import logging
+import os
 import time
+import zlib
 
 import numpy as np
 import scipy as sp
+import scipy.spatial
+import scipy.sparse.csgraph
 import trimesh as tm
 
-from scipy.sparse.linalg import lsqr
+from scipy.sparse.linalg import lsqr, lsmr, splu
 from tqdm.auto import tqdm
 
-from .utilities import (laplacian_cotangent, getMeshVPos, laplacian_umbrella,
-                        averageFaceArea, getOneRingAreas, make_trimesh)
+try:
+    from sksparse.cholmod import cholesky
+except ImportError:
+    cholesky = None
+except BaseException:
+    raise
+
+from .cache import ContractionCache
+from .preprocessing import decimate
+from .profiling import stage
+from .utilities import (laplacian_plan, laplacian_from_plan, averageFaceArea,
+                        face_areas, one_ring_areas, make_trimesh, run_jobs)
 
 logger = logging.getLogger('skeletor')
 
@@ -36,8 +50,11 @@ if not logger.handlers:
 
 
 def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
-             SL=2, WH0=1, WL0='auto', operator='cotangent', progress=True,
-             validate=True):
+             SL=2, WH0=1, WL0='auto', operator='cotangent', solver='lsqr',
+             warm_start=False, coarsen=None, fine_iter_lim=1, freeze=None,
+             n_jobs=None, tile_size=None, tile_halo='auto', checkpoint=None,
+             resume=False, dtype=None, cache=None, progress=True,
+             validate=True, profiler=None):
     """Contract mesh.
 
     In a nutshell: this function contracts the mesh by applying rounds of
@@ -71,12 +88,20 @@ def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
                     Maximum run time in seconds. Note that this limit is not
                     checked during but after each round of contraction. Hence,
                     the actual total time will likely overshoot ``time_lim``.
-    precision :     float, optional
+    precision :     float | tuple of two floats, optional
                     Sets the precision for finding the least-square solution.
                     This is the main determinant for speed vs quality: lower
                     values will take (much) longer but will get you closer to an
                     optimally contracted mesh. Higher values will be faster but
-                    the iterative contractions might stop early.
+                    the iterative contractions might stop early. If a tuple
+                    ``(loose, tight)`` is provided, the precision will start
+                    out at ``loose`` and is then tightened (geometrically) as
+                    the area ratio approaches ``epsilon`` and the iterations
+                    approach ``iter_lim``. The last iteration is always solved
+                    at ``tight``. Note that this is not a reliable speed-up:
+                    early iterations get cheaper but the errors they leave
+                    behind make later iterations more expensive. Try e.g.
+                    ``(1e-5, 1e-7)`` and compare against a single precision.
     SL :            float, optional
                     Factor by which the contraction matrix is multiplied for
                     each iteration. Higher values = quicker contraction, lower
@@ -105,6 +130,121 @@ def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
                         it more robust against flaws in the mesh! Use it when
                         the cotangent operator produces oddly contracted meshes.
 
+    solver :        "lsqr" | "lsmr" | "cholesky"
+                    How to solve the linear system in each iteration:
+
+                      - "lsqr" (default) iteratively finds a least-square
+                        solution for each of the x/y/z coordinates separately.
+                        Speed and quality are governed by ``precision``.
+                      - "lsmr" same as "lsqr" but uses the LSMR algorithm
+                        which tends to converge more smoothly and can be
+                        faster when stopping early (i.e. at low precision).
+                      - "cholesky" factorizes the normal equations once per
+                        iteration and solves for all three coordinates against
+                        that factorization. This gives exact solutions and is
+                        typically several times faster but needs more memory.
+                        Uses CHOLMOD if ``scikit-sparse`` is installed and falls
+                        back to scipy's SuperLU otherwise. ``precision`` and
+                        ``warm_start`` are ignored.
+
+    warm_start :    bool
+                    If True, will start the "lsqr"/"lsmr" solvers from the
+                    correction found in the previous iteration instead of
+                    from scratch. This does not change the solution. The
+                    previous correction is only a rough guess for the next
+                    one though, so expect to save a few percent of solver
+                    iterations at best.
+
+    coarsen :       float (0-1), optional
+                    If provided, will run a coarse-to-fine contraction: first
+                    a decimated proxy of the mesh with roughly
+                    ``coarsen * N`` vertices is contracted (see
+                    ``skeletor.preprocessing.decimate``). The contracted
+                    positions of the proxy's vertices are then interpolated
+                    onto the full-resolution mesh and used as starting point
+                    for a few more rounds of contraction (see
+                    ``fine_iter_lim``). This can
+                    be a lot faster for large meshes. ``iter_lim`` applies to
+                    the coarse contraction.
+    fine_iter_lim : int, optional
+                    Maximum rounds of contraction on the full-resolution mesh
+                    after a coarse contraction. Ignored if ``coarsen=None``.
+    freeze :        float (0-1), optional
+                    If provided, vertices that have (mostly) stopped moving
+                    are frozen in place: subsequent iterations treat them as
+                    fixed constraints and only solve for the vertices that are
+                    still moving. A vertex is frozen if its displacement in
+                    the last iteration is less than ``freeze`` times the total
+                    distance it has travelled so far. This makes later
+                    iterations a lot cheaper at the cost of a slightly less
+                    even contraction. Reasonable values are in the range of
+                    ``0.01`` to ``0.1``.
+    n_jobs :        int, optional
+                    If provided (and not 1), will split the mesh into its
+                    connected components and contract them in parallel using
+                    ``n_jobs`` processes (-1 for all available cores). Each
+                    component is contracted independently, i.e. will stop
+                    once it itself reached ``epsilon``. Only useful for meshes
+                    with multiple (large) disconnected pieces. If used
+                    together with ``tile_size``, will contract tiles in
+                    parallel instead.
+    tile_size :     float, optional
+                    If provided, will cut the mesh into cubic tiles of this
+                    size (in mesh units) and contract each tile independently.
+                    Use this for meshes too large to be contracted in one go:
+                    peak memory then depends on the size of the tiles rather
+                    than that of the whole mesh. Each tile is contracted
+                    together with a halo (see ``tile_halo``) around it with
+                    the vertices along the cut softly pinned in place. Only
+                    the contracted positions of vertices inside the tile
+                    proper are kept. ``epsilon`` applies to each tile
+                    individually. Can not be combined with ``coarsen``.
+                    Note that tiles contract less well than the whole mesh
+                    and that the total run time goes up as tiles get
+                    smaller. Tiles should be at least 3x as large as the
+                    thickness of the mesh's branches: e.g. on a 60x10x10 box,
+                    tiles of 20 leave several times more surface area than
+                    no tiling and take several times as long, while tiles of
+                    5 barely contract at all. A warning is logged if
+                    ``tile_size`` or ``tile_halo`` look too small.
+    tile_halo :     "auto" | float
+                    Size of the overlap around each tile. Should be large
+                    enough to cover the thickness of the mesh's neurites/
+                    branches. By default ("auto") will use half the
+                    ``tile_size``.
+    checkpoint :    str, optional
+                    Path to a checkpoint file (``.npz``). If provided, the
+                    state of the contraction (vertex positions, contraction
+                    and attraction weights, area ratios, etc.) is written to
+                    this file after each successful iteration. Writes are
+                    atomic, i.e. the file is never left half-written if the
+                    process is killed. Can not be combined with ``coarsen``,
+                    ``tile_size`` or parallel processing (``n_jobs``).
+    resume :        bool
+                    If True and ``checkpoint`` exists, will continue the
+                    contraction from the last iteration stored in it instead
+                    of starting from scratch. The checkpoint must have been
+                    produced with the same mesh and the same ``SL``, ``WH0``,
+                    ``operator``, ``precision`` and ``epsilon``. A checkpoint
+                    that stopped at ``iter_lim`` or ``time_lim`` can be
+                    resumed with a higher limit. Note that ``iter_lim``
+                    counts the iterations done before the checkpoint while
+                    ``time_lim`` only applies to this run.
+    dtype :         "float32" | "float64", optional
+                    Working precision for vertex positions and the linear
+                    system. Using float32 roughly halves the memory footprint
+                    (and memory bandwidth) of the "lsqr"/"lsmr" solvers.
+                    Laplacian weights are always calculated in float64 and
+                    the "cholesky" solver always factorizes in float64.
+                    Defaults to float64. The returned mesh's vertices are
+                    always float64 (trimesh enforces that).
+    cache :         str | skeletor.cache.ContractionCache, optional
+                    Directory (or cache object) to cache contracted vertex
+                    positions in. If the same mesh has been contracted with
+                    the same parameters before, the result is loaded from
+                    the cache instead of being recomputed. Runs stopped by
+                    ``time_lim`` are not cached. See ``skeletor.cache``.
+
     progress :      bool
                     Whether or not to show a progress bar.
     validate :      bool
@@ -112,6 +252,11 @@ def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
                     (e.g. infinite values, duplicate vertices, degenerate faces)
                     before collapsing. Degenerate meshes can lead to effectively
                     infinite runtime for this function!
+    profiler :      callable, optional
+                    If provided, will be called with timing/memory events for
+                    this function and its sub-stages (Laplacian, solve, area
+                    check). See ``skeletor.profiling``. Sub-stages run in
+                    separate processes (see ``n_jobs``) are not reported.
 
     Returns
     -------
@@ -125,95 +270,466 @@ def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
 
     """
     assert operator in ('cotangent', 'umbrella')
+    assert solver in ('lsqr', 'lsmr', 'cholesky')
+    if isinstance(precision, (tuple, list)):
+        assert len(precision) == 2, 'precision must be float or (loose, tight)'
+    if coarsen:
+        assert 0 < coarsen < 1, 'coarsen must be between 0 and 1'
+        if tile_size:
+            raise ValueError('`coarsen` and `tile_size` can not be combined')
+    if checkpoint and (coarsen or tile_size or n_jobs not in (None, 1)):
+        raise ValueError('`checkpoint` can not be combined with `coarsen`, '
+                         '`tile_size` or `n_jobs`')
+    if resume and not checkpoint:
+        raise ValueError('`resume` requires a `checkpoint`')
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    assert dtype in (np.float32, np.float64), 'dtype must be float32 or float64'
     start = time.time()
 
-    # Force into trimesh
-    m = make_trimesh(mesh, validate=validate)
-    n = len(m.vertices)
+    if cache is not None and not isinstance(cache, ContractionCache):
+        cache = ContractionCache(cache)
 
-    # Initialize attraction weights
-    zeros = np.zeros((n, 3))
-    WH0_diag = np.zeros(n)
-    WH0_diag.fill(WH0)
-    WH0 = sp.sparse.spdiags(WH0_diag, 0, WH0_diag.size, WH0_diag.size)
-    # Make a copy but keep original values
-    WH = sp.sparse.dia_matrix(WH0)
+    with stage(profiler, 'contract') as event:
+        # Force into trimesh
+        m = make_trimesh(mesh, validate=validate)
+        event['n_vertices'] = len(m.vertices)
+
+        params = dict(epsilon=epsilon, iter_lim=iter_lim, time_lim=time_lim,
+                      precision=precision, SL=SL, WH0=WH0, WL0=WL0,
+                      operator=operator, solver=solver, warm_start=warm_start,
+                      coarsen=coarsen, fine_iter_lim=fine_iter_lim,
+                      freeze=freeze, n_jobs=n_jobs, tile_size=tile_size,
+                      tile_halo=tile_halo, dtype=dtype)
+
+        V = None
+        if cache is not None:
+            # Timed-out runs are never cached (see below), so ``time_lim``
+            # does not affect cached results
+            key = cache.key(m, **{k: v for k, v in params.items()
+                                  if k != 'time_lim'})
+            V = cache.get(key)
+            event['cached'] = V is not None
+            if V is not None:
+                # Copy out of the (read-only) memory map so that cached and
+                # uncached results behave the same
+                V = np.array(V, dtype=np.float64)
+
+        if V is None:
+            V = _contract(m, checkpoint=checkpoint, resume=resume,
+                          progress=progress, start=start, profiler=profiler,
+                          **params)
+            # Only cache results of runs that finished (converged, hit
+            # ``iter_lim`` or stopped because the area increased) - a run cut
+            # short by ``time_lim`` depends on the machine's speed
+            if cache is not None and not _timed_out(time_lim, start):
+                cache.put(key, V)
+
+    # Copy mesh and update vertex positions
+    dm = m.copy()
+    dm.vertices = V
 
+    return dm
+
+
+def _contract(m, WL0, iter_lim, coarsen, fine_iter_lim, n_jobs, tile_size,
+              tile_halo, **loop_kwargs):
+    """Dispatch contraction and return contracted vertex positions."""
     # Initialize contraction weights
     if WL0 == 'auto':
         WL0 = 1e-03 * np.sqrt(averageFaceArea(m))
         #WL0 = 1.0 / 10.0 * np.sqrt(averageFaceArea(m))
-    WL_diag = np.zeros(n)
-    WL_diag.fill(WL0)
-    WL = sp.sparse.spdiags(WL_diag, 0, WL_diag.size, WL_diag.size)
 
-    # Copy mesh
-    dm = m.copy()
+    if tile_size:
+        V = _contract_tiles(m, WL0=WL0, iter_lim=iter_lim, coarsen=None,
+                            fine_iter_lim=fine_iter_lim, tile_size=tile_size,
+                            tile_halo=tile_halo, n_jobs=n_jobs, **loop_kwargs)
+    elif n_jobs not in (None, 1):
+        V = _contract_components(m, WL0=WL0, iter_lim=iter_lim,
+                                 coarsen=coarsen, fine_iter_lim=fine_iter_lim,
+                                 n_jobs=n_jobs, **loop_kwargs)
+    else:
+        V = _contract_mesh(m, WL0=WL0, iter_lim=iter_lim, coarsen=coarsen,
+                           fine_iter_lim=fine_iter_lim, **loop_kwargs)
+
+    return V
+
+
+def _contract_mesh(m, WL0, iter_lim, coarsen, fine_iter_lim, **kwargs):
+    """Contract mesh (optionally coarse-to-fine) and return vertex positions.
+
+    See ``contract`` for parameters. ``kwargs`` are passed through to
+    ``_contract_loop``.
+    """
+    V0 = None
+    if coarsen:
+        # Contract a decimated proxy of the mesh...
+        with stage(kwargs.get('profiler'), 'contract.decimate'):
+            proxy = decimate(m, ratio=coarsen)
+        # Contraction weights scale with the coarseness of the mesh
+        WL0_proxy = WL0 * np.sqrt(averageFaceArea(proxy) / averageFaceArea(m))
+        V_proxy, WL_proxy, _ = _contract_loop(proxy, WL0=WL0_proxy,
+                                              iter_lim=iter_lim, **kwargs)
+
+        # ... and interpolate the contracted positions of the proxy's
+        # vertices onto the full-resolution mesh to use as warm start
+        V0 = _interpolate_positions(proxy.vertices, V_proxy, m.vertices)
+
+        # Contraction forces pick up where the proxy left off
+        WL0 = WL0 * WL_proxy / WL0_proxy
+        iter_lim = fine_iter_lim
+
+    V, _, _ = _contract_loop(m, WL0=WL0, V0=V0, iter_lim=iter_lim, **kwargs)
+
+    return V
+
+
+def _contract_components(m, n_jobs, progress, **kwargs):
+    """Contract connected components of the mesh in parallel processes.
+
+    The Laplacian of a mesh with multiple connected components is
+    block-diagonal, i.e. each component can be contracted independently.
+    Note that this also means that each component stops contracting on its
+    own (e.g. when reaching ``epsilon``).
+
+    Returns
+    -------
+    V :     (N, 3) array
+            Contracted vertex positions in the original order.
+
+    """
+    n_comp, labels = sp.sparse.csgraph.connected_components(m.edges_sparse,
+                                                            directed=False)
+
+    V = np.array(m.vertices)
+
+    # Group vertices and faces by component
+    vert_order = np.argsort(labels, kind='stable')
+    vert_counts = np.bincount(labels, minlength=n_comp)
+    comp_verts = np.split(vert_order, np.cumsum(vert_counts)[:-1])
+
+    face_labels = labels[m.faces[:, 0]]
+    face_order = np.argsort(face_labels, kind='stable')
+    face_counts = np.bincount(face_labels, minlength=n_comp)
+    comp_faces = np.split(face_order, np.cumsum(face_counts)[:-1])
+
+    # Index of each vertex within its component
+    local_ix = np.empty(len(labels), dtype=int)
+    local_ix[vert_order] = np.arange(len(labels)) - np.repeat(np.cumsum(vert_counts) - vert_counts,
+                                                              vert_counts)
+
+    # Skip components without faces and start with the largest ones
+    to_run = [c for c in np.argsort(face_counts)[::-1] if face_counts[c]]
+    if len(to_run) <= 1:
+        return _contract_mesh(m, progress=progress, **kwargs)
+
+    jobs = ((c, dict(verts=V[comp_verts[c]],
+                     faces=local_ix[m.faces[comp_faces[c]]],
+                     progress=False,
+                     **kwargs)) for c in to_run)
+    for c, res in run_jobs(_contract_component, jobs, n_jobs=n_jobs,
+                           total=len(to_run), desc='Contracting components',
+                           progress=progress):
+        V[comp_verts[c]] = res
+
+    return V
+
+
+def _contract_tiles(m, tile_size, tile_halo, n_jobs, progress, **kwargs):
+    """Contract mesh in spatial tiles.
+
+    The mesh is cut into cubic tiles of ``tile_size``. Each tile plus a halo
+    of ``tile_halo`` around it is contracted independently with the vertices
+    along the cut softly pinned in place. Only the results for vertices
+    inside the tile proper are kept.
+
+    Returns
+    -------
+    V :     (N, 3) array
+            Contracted vertex positions in the original order.
+
+    """
+    if tile_halo == 'auto':
+        tile_halo = tile_size / 2
+
+    _check_tiles(m, tile_size, tile_halo)
+
+    verts = np.asarray(m.vertices)
+    faces = np.asarray(m.faces)
+    origin = verts.min(axis=0)
+
+    # Assign vertices and faces (by their center) to tiles
+    vert_tiles = np.floor((verts - origin) / tile_size).astype(np.int64)
+    centers = verts[faces].mean(axis=1)
+    face_tiles = np.floor((centers - origin) / tile_size).astype(np.int64)
+
+    # Group faces by tile
+    face_keys, face_tile_ix = np.unique(face_tiles, axis=0, return_inverse=True)
+    face_tile_ix = face_tile_ix.flatten()
+    face_order = np.argsort(face_tile_ix, kind='stable')
+    face_groups = np.split(face_order,
+                           np.cumsum(np.bincount(face_tile_ix))[:-1])
+    tile_faces = {tuple(t): f for t, f in zip(face_keys, face_groups)}
 
-    area_ratios = [1.0]
-    originalRingAreas = getOneRingAreas(dm)
-    goodvertices = dm.vertices
+    # Each vertex is owned by the tile it is in
+    tiles = np.unique(vert_tiles, axis=0)
+
+    # Faces in the halo can only come from neighbouring tiles
+    reach = int(np.ceil(tile_halo / tile_size))
+    offsets = np.stack(np.meshgrid(*[np.arange(-reach, reach + 1)] * 3),
+                       axis=-1).reshape(-1, 3)
+
+    # Collect faces whose center is inside the tile + halo and skip tiles
+    # without any faces
+    tile_cand = []
+    for t in tiles:
+        cand = [tile_faces[k] for k in map(tuple, t + offsets) if k in tile_faces]
+        if not cand:
+            continue
+        cand = np.concatenate(cand)
+        lo = origin + t * tile_size - tile_halo
+        hi = origin + (t + 1) * tile_size + tile_halo
+        cand = cand[np.all((centers[cand] >= lo) & (centers[cand] < hi), axis=1)]
+        if len(cand):
+            tile_cand.append((t, cand))
+
+    def make_jobs():
+        for t, cand in tile_cand:
+            # Generate local vertex indices
+            tile_verts, tile_faces_local = np.unique(faces[cand], return_inverse=True)
+            tile_faces_local = tile_faces_local.reshape(-1, 3)
+
+            # Softly pin vertices along the cut (i.e. edges with only one face)
+            # so that the tile doesn't retract from its open ends. Pinning
+            # them much harder than this prevents the tile from contracting
+            WH0 = np.full(len(tile_verts), kwargs['WH0'], dtype=float)
+            WH0[_boundary_vertices(tile_faces_local)] *= 3
+
+            # Only vertices in the tile proper are kept
+            owned = np.all(vert_tiles[tile_verts] == t, axis=1)
+
+            yield tile_verts[owned], dict(verts=verts[tile_verts],
+                                          faces=tile_faces_local,
+                                          keep=owned,
+                                          progress=False,
+                                          boundary=True,
+                                          **{**kwargs, 'WH0': WH0})
+
+    V = verts.copy()
+    for owned, res in run_jobs(_contract_component, make_jobs(), n_jobs=n_jobs,
+                               total=len(tile_cand), desc='Contracting tiles',
+                               progress=progress):
+        V[owned] = res
+
+    return V
+
+
+def _check_tiles(m, tile_size, tile_halo):
+    """Warn if tiles are too small to contract properly.
+
+    Tiles need to span many edges and their halo needs to cover the thickness
+    of the mesh's branches. For watertight meshes, we estimate that thickness
+    as ``4 * volume / area`` (i.e. the diameter for a cylinder).
+    """
+    edge_length = m.edges_unique_length.mean()
+    if tile_size < 5 * edge_length:
+        logger.warning(f'`tile_size` ({tile_size:.3g}) is less than 5x the '
+                       f'average edge length ({edge_length:.3g}): tiles will '
+                       'contract poorly.')
+
+    if m.is_watertight:
+        thickness = 4 * abs(m.volume) / m.area
+        if tile_size < 3 * thickness or tile_halo < 1.5 * thickness:
+            logger.warning(f'`tile_size` ({tile_size:.3g}) or `tile_halo` '
+                           f'({tile_halo:.3g}) is small compared to the '
+                           f'thickness of the mesh (~{thickness:.3g}): expect '
+                           'poor contraction and long run times. Use a '
+                           '`tile_size` of at least 3x and a `tile_halo` of '
+                           'at least 1.5x the thickness.')
+
+
+def _boundary_vertices(faces):
+    """Return vertices along edges that are part of only a single face."""
+    edges = np.sort(np.concatenate((faces[:, [0, 1]],
+                                    faces[:, [1, 2]],
+                                    faces[:, [2, 0]])), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    return np.unique(edges[counts == 1])
+
+
+def _contract_component(verts, faces, keep=None, **kwargs):
+    """Contract a single connected component or tile.
+
+    Returns contracted vertex positions (only those in ``keep`` if provided).
+    """
+    m = tm.Trimesh(vertices=verts, faces=faces, process=False)
+    V = _contract_mesh(m, **kwargs)
+    return V if keep is None else V[keep]
+
+
+def _contract_loop(m, WL0, iter_lim, epsilon, time_lim, precision, SL, WH0,
+                   operator, solver, progress, start, freeze=None, V0=None,
+                   warm_start=False, boundary=False, checkpoint=None,
+                   resume=False, dtype=np.float64, profiler=None):
+    """Run rounds of contraction on given mesh.
+
+    Parameters
+    ----------
+    m :         trimesh.Trimesh
+                The (original) mesh to contract.
+    WL0 :       float
+                Initial weight factor for the contraction constraints. Note
+                that contraction weights are the same for all vertices.
+    WH0 :       float | (N, ) array
+                Initial weight factor(s) for the attraction constraints.
+    V0 :        (N, 3) array, optional
+                Vertex positions to start from. If not provided will start
+                from the mesh's vertices.
+    start :     float
+                Start time (used for ``time_lim``).
+    boundary :  bool
+                Whether to weigh edges along open boundaries in the cotangent
+                Laplacian. See ``laplacian_plan``.
+    checkpoint : str, optional
+                File to write the state to after each iteration.
+    resume :    bool
+                Whether to pick up from the state in ``checkpoint`` (if it
+                exists).
+    dtype :     numpy dtype
+                Working precision for vertex positions and the linear system.
+
+    See ``contract`` for the remaining parameters.
+
+    Returns
+    -------
+    V :             (N, 3) array
+                    Contracted vertex positions.
+    WL :            float
+                    Contraction weight to use for any subsequent iterations.
+    area_ratios :   list of float
+
+    """
+    n = len(m.vertices)
+    dtype = np.dtype(dtype)
+
+    # Parameters that a checkpoint's state depends on
+    params = _checkpoint_params(SL=SL, WH0=WH0, operator=operator,
+                                precision=precision, epsilon=epsilon)
+
+    # Initialize attraction weights
+    zeros = np.zeros((n, 3), dtype=dtype)
+    WH0_diag = np.zeros(n, dtype=dtype)
+    WH0_diag[:] = WH0
+    WH0 = sp.sparse.spdiags(WH0_diag, 0, WH0_diag.size, WH0_diag.size)
+
+    # Initialize contraction weights
+    WL = WL0
+
+    # Precompute everything that only depends on the topology of the mesh
+    # (which does not change during contraction): this way we only have to
+    # fill in the weights for the Laplacian in each iteration and we can work
+    # on plain vertex arrays without constantly invalidating trimesh's cache
+    with stage(profiler, 'contract.laplacian_plan'):
+        plan = laplacian_plan(m, operator=operator, boundary=boundary)
+        faces = np.asarray(m.faces)
+        V = np.array(m.vertices, dtype=dtype)
+        originalArea = face_areas(V, faces).sum()
+        originalRingAreas = one_ring_areas(V, faces)
+
+    # Track vertices that have been frozen in place
+    frozen = np.zeros(n, dtype=bool)
+    travelled = np.zeros(n)
+
+    if V0 is not None:
+        V = np.array(V0, dtype=dtype)
+
+    area_ratios = [face_areas(V, faces).sum() / originalArea]
+    goodvertices = V
+    dx = None
+    WH_diag = WH0_diag
+    first_iter = n_iter = 0
+    converged = False
+
+    # Pick up from where a previous run left off
+    if resume and os.path.isfile(checkpoint):
+        state = load_checkpoint(checkpoint, mesh=m, params=params)
+        if state['done']:
+            logger.info(f'Checkpoint {checkpoint} is already complete')
+            return state['V'], state['WL'], state['area_ratios']
+        goodvertices = V = state['V'].astype(dtype, copy=False)
+        WL = state['WL']
+        area_ratios = state['area_ratios']
+        frozen = state['frozen']
+        travelled = state['travelled']
+        dx = state['dx']
+        first_iter = n_iter = state['iteration']
     bar_format = ("{l_bar}{bar}| [{elapsed}<{remaining}, "
                   "{postfix[0]}/{postfix[1]}it, "
                   "{rate_fmt}, epsilon {postfix[2]:.2g}")
     with tqdm(total=100,
               bar_format=bar_format,
               disable=progress is False,
-              postfix=[1, iter_lim, 1]) as pbar:
-        for i in range(iter_lim):
-            # Get Laplace weights
-            if operator == 'cotangent':
-                L = laplacian_cotangent(dm, normalized=True)
-            else:
-                L = laplacian_umbrella(dm)
-
-            V = getMeshVPos(dm)
-            A = sp.sparse.vstack([WL.dot(L), WH])
-            b = np.vstack((zeros, WH.dot(V)))
-
-            cpts = np.zeros((n, 3))
-            for j in range(3):
-                """
-                # Solve A*x = b
-                # Note that we force scipy's lsqr() to use current vertex
-                # positions as start points - this speeds things up and
-                # without it we get suboptimal solutions that lead to early
-                # termination
-                cpts[:, j] = lsqr(A, b[:, j],
-                                  atol=precision, btol=precision,
-                                  damp=1,
-                                  x0=dm.vertices[:, j])[0]
-                """
-                # The solution below is recommended in scipy's lsqr docstring
-                # for when we have an initial estimate
-                # Gives use the same results as above but is slightly faster
-
-                # Initial estimate (i.e. our current positions)
-                x0 = dm.vertices[:, j]
-                # Compute residual vector
-                r0 = b[:, j] - A * x0
-                # Use LSQR to solve the system
-                dx = lsqr(A, r0,
-                          atol=precision, btol=precision,
-                          damp=1)[0]
-                # Add the correction dx to obtain a final solution
-                cpts[:, j] = x0 + dx
-
-            # Update mesh with new vertex position
-            dm.vertices = cpts
+              postfix=[first_iter + 1, iter_lim, area_ratios[-1]]) as pbar:
+        for i in range(first_iter, iter_lim):
+            with stage(profiler, 'contract.laplacian', iteration=i):
+                # Update attraction weights -> the smaller the one ring areas
+                # the higher the attraction forces
+                changeinarea = np.sqrt(originalRingAreas / one_ring_areas(V, faces))
+                WH = sp.sparse.dia_matrix(WH0.multiply(changeinarea.astype(dtype)))
+                WH_diag = WH.diagonal()
+
+                # Get Laplace weights
+                L = laplacian_from_plan(plan, V, normalized=True, dtype=dtype)
+
+                A = sp.sparse.vstack([dtype.type(WL) * L, WH])
+                b = np.vstack((zeros, WH.dot(V)))
+
+            # Precision for this iteration
+            tol = _scheduled_precision(precision, area_ratios[-1], epsilon,
+                                       done=(i + 1) / iter_lim)
+
+            # Start from the previous correction if so desired
+            dx0 = dx if warm_start else None
+
+            with stage(profiler, 'contract.solve', iteration=i,
+                       solver=solver, precision=tol, frozen=frozen.sum()):
+                if frozen.any():
+                    # Only solve for vertices that are still moving and treat
+                    # the frozen ones as fixed constraints
+                    cpts = V.copy()
+                    cpts[~frozen] = _solve_reduced(A, b, V, frozen,
+                                                   solver=solver,
+                                                   precision=tol,
+                                                   dx0=dx0)
+                elif solver == 'cholesky':
+                    cpts = solve_cholesky(A, b, x0=V)
+                elif solver == 'lsmr':
+                    cpts = solve_lsmr(A, b, x0=V, precision=tol, dx0=dx0)
+                else:
+                    cpts = solve_lsqr(A, b, x0=V, precision=tol, dx0=dx0)
+
+            # Keep track of the correction
+            dx = cpts - V
+
+            # Track how far each vertex has moved
+            displacement = np.linalg.norm(cpts - V, axis=1)
+
+            # Update vertex positions
+            V = cpts
 
             # Update iteration in progress bar
             if progress:
                 pbar.postfix[0] = i + 1
 
             # Break if face area has increased compared to the last iteration
-            area_ratios.append(dm.area / m.area)
+            with stage(profiler, 'contract.area_check', iteration=i) as event:
+                area_ratios.append(face_areas(V, faces).sum() / originalArea)
+                event['area_ratio'] = area_ratios[-1]
             if (area_ratios[-1] > area_ratios[-2]):
-                dm.vertices = goodvertices
                 if progress:
                     tqdm.write("Total face area increased from last iteration."
                                f" Contraction stopped prematurely after {i} "
                                f"iterations at epsilon {area_ratios[-2]:.2g}.")
+                converged = True
                 break
 
             # Update progress bar
@@ -223,23 +739,401 @@ def contract(mesh, epsilon=1e-06, iter_lim=10, time_lim=None, precision=1e-07,
                 pbar.update(min(prog, 100-pbar.n))
 
             goodvertices = cpts
+            n_iter = i + 1
+
+            # Freeze vertices that have (mostly) stopped moving
+            travelled += displacement
+            if freeze:
+                frozen |= displacement < freeze * travelled
+                if frozen.all():
+                    converged = True
+                    break
 
             # Update contraction weights -> at each iteration the contraction
             # forces increase to counteract the increased attraction forces
-            WL = sp.sparse.dia_matrix(WL.multiply(SL))
+            WL *= SL
 
-            # Update attraction weights -> the smaller the one ring areas
-            # the higher the attraction forces
-            changeinarea = np.sqrt(originalRingAreas / getOneRingAreas(dm))
-            WH = sp.sparse.dia_matrix(WH0.multiply(changeinarea))
+            if checkpoint:
+                save_checkpoint(checkpoint, mesh=m, V=goodvertices, WL=WL,
+                                WH=WH_diag, area_ratios=area_ratios,
+                                iteration=i + 1, frozen=frozen,
+                                travelled=travelled, dx=dx, params=params)
 
             # Stop if we reached our target contraction rate
             if (area_ratios[-1] <= epsilon):
+                converged = True
                 break
 
             # Stop if time limit is reached
-            if not isinstance(time_lim, (bool, type(None))):
-                if (time.time() - start) >= time_lim:
-                    break
+            if _timed_out(time_lim, start):
+                break
+
+    if checkpoint:
+        # Mark checkpoint as complete if the contraction has converged (or
+        # the area increased) so that resuming won't continue contracting
+        # past where this run stopped. Runs that stopped because of
+        # ``iter_lim`` or ``time_lim`` can be resumed with higher limits.
+        save_checkpoint(checkpoint, mesh=m, V=goodvertices, WL=WL,
+                        WH=WH_diag, area_ratios=area_ratios,
+                        iteration=n_iter, frozen=frozen,
+                        travelled=travelled, dx=dx, params=params,
+                        done=converged)
+
+    return goodvertices, WL, area_ratios
+
+
+def _timed_out(time_lim, start):
+    """Check whether ``time_lim`` (if any) has been reached."""
+    if isinstance(time_lim, (bool, type(None))):
+        return False
+    return (time.time() - start) >= time_lim
+
+
+def save_checkpoint(path, mesh, V, WL, WH, area_ratios, iteration, frozen=None,
+                    travelled=None, dx=None, params=None, done=False):
+    """Write the state of a contraction to disk.
+
+    The file is first written to a temporary file and then moved in place:
+    if the process gets killed midway, the previous checkpoint stays intact.
+
+    Parameters
+    ----------
+    path :          str
+                    Filename. Should end with ``.npz``.
+    mesh :          trimesh.Trimesh
+                    The original (i.e. not contracted) mesh. Used to make sure
+                    that we only ever resume with the same mesh.
+    V :             (N, 3) array
+                    Vertex positions after the last good iteration.
+    WL :            float
+                    Contraction weight for the next iteration.
+    WH :            (N, ) array
+                    Attraction weights (i.e. the diagonal) used in the last
+                    iteration.
+    area_ratios :   list of float
+                    Area ratios for each iteration so far.
+    iteration :     int
+                    Number of iterations completed.
+    frozen :        (N, ) bool array, optional
+    travelled :     (N, ) array, optional
+    dx :            (N, 3) array, optional
+                    Correction from the last iteration (for warm starts).
+    params :        dict, optional
+                    Contraction parameters the state depends on. See
+                    ``_checkpoint_params``.
+    done :          bool
+                    Whether the contraction has finished (i.e. converged or
+                    stopped because the area increased).
+
+    """
+    n = len(mesh.vertices)
+    state = dict(V=np.asarray(V),
+                 WL=np.float64(WL),
+                 WH=np.asarray(WH),
+                 area_ratios=np.asarray(area_ratios),
+                 iteration=np.int64(iteration),
+                 frozen=np.zeros(n, dtype=bool) if frozen is None else frozen,
+                 travelled=np.zeros(n) if travelled is None else travelled,
+                 dx=np.zeros((0, 3)) if dx is None else dx,
+                 done=np.bool_(done),
+                 fingerprint=np.asarray(_mesh_fingerprint(mesh)))
+    for k, v in (params or {}).items():
+        state[f'param_{k}'] = v
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **state)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path, mesh=None, params=None):
+    """Load the state of a contraction from disk.
+
+    Parameters
+    ----------
+    path :      str
+                Checkpoint file as written by ``contract(checkpoint=...)``.
+    mesh :      trimesh.Trimesh, optional
+                If provided, will check that the checkpoint was produced for
+                this mesh.
+    params :    dict, optional
+                If provided, will check that the checkpoint was produced with
+                these contraction parameters. See ``_checkpoint_params``.
+
+    Returns
+    -------
+    state :     dict
+                See ``save_checkpoint``.
+
+    """
+    with np.load(path) as f:
+        state = {k: f[k] for k in f.files}
+
+    if mesh is not None:
+        if not np.array_equal(state['fingerprint'], _mesh_fingerprint(mesh)):
+            raise ValueError(f'Checkpoint "{path}" was produced for a different mesh')
+
+    for k, v in (params or {}).items():
+        if not np.array_equal(state.get(f'param_{k}'), v):
+            raise ValueError(f'Checkpoint "{path}" was produced with a '
+                             f'different `{k}`')
+
+    state['WL'] = float(state['WL'])
+    state['iteration'] = int(state['iteration'])
+    state['done'] = bool(state['done'])
+    state['area_ratios'] = state['area_ratios'].tolist()
+    if not len(state['dx']):
+        state['dx'] = None
+
+    return state
+
+
+def _checkpoint_params(SL, WH0, operator, precision, epsilon):
+    """Turn contraction parameters into arrays to store in a checkpoint."""
+    return dict(SL=np.float64(SL),
+                WH0=np.asarray(WH0, dtype=np.float64),
+                operator=np.str_(operator),
+                precision=np.asarray(precision, dtype=np.float64),
+                epsilon=np.float64(epsilon))
+
+
+def _mesh_fingerprint(mesh):
+    """Cheap fingerprint of a mesh: number of vertices/faces and checksums."""
+    verts = np.ascontiguousarray(mesh.vertices, dtype=np.float64)
+    faces = np.ascontiguousarray(mesh.faces, dtype=np.int64)
+    return [len(verts), len(faces),
+            zlib.crc32(verts.tobytes()), zlib.crc32(faces.tobytes())]
+
+
+def _solve_reduced(A, b, V, frozen, solver, precision, dx0=None):
+    """Solve ``A * x = b`` only for vertices that are not frozen.
+
+    Frozen vertices are moved to the right-hand side as fixed constraints and
+    rows that don't involve any of the free vertices are dropped.
+    """
+    A = A.tocsc()
+    free = ~frozen
+
+    b = b - A[:, frozen] @ V[frozen]
+    A = A[:, free].tocsr()
+
+    rows = A.getnnz(axis=1) > 0
+    A, b = A[rows], b[rows]
+
+    if dx0 is not None:
+        dx0 = dx0[free]
+
+    if solver == 'cholesky':
+        return solve_cholesky(A, b, x0=V[free])
+    elif solver == 'lsmr':
+        return solve_lsmr(A, b, x0=V[free], precision=precision, dx0=dx0)
+    return solve_lsqr(A, b, x0=V[free], precision=precision, dx0=dx0)
+
+
+def _scheduled_precision(precision, ratio, epsilon, done=0):
+    """Get solver precision for the current area ratio.
+
+    For a ``(loose, tight)`` tuple, the precision is interpolated geometrically
+    between the two depending on how far (in log space) the current area
+    ratio has come towards ``epsilon`` or on the fraction ``done`` of the
+    iteration budget that has been used - whichever is further along. The
+    latter makes sure that the last iteration is always solved at ``tight``
+    even if ``epsilon`` is never reached.
+    """
+    if not isinstance(precision, (tuple, list)):
+        return precision
+
+    loose, tight = precision
+    t = done
+    if ratio < 1 and epsilon < 1:
+        t = max(t, np.log(ratio) / np.log(epsilon))
+
+    t = min(1, max(0, t))
+    return loose ** (1 - t) * tight ** t
+
+
+def _interpolate_positions(source, target, verts, k=3):
+    """Map vertices from ``source`` -> ``target`` positions onto ``verts``.
+
+    Uses inverse-distance weighting over the ``k`` closest ``source`` vertices.
+    Note that we need more than just the closest vertex: otherwise many
+    vertices end up in the exact same place and we get fully degenerate faces.
+    """
+    k = min(k, len(source))
+    dist, ix = sp.spatial.cKDTree(source).query(verts, k=list(range(1, k + 1)))
+
+    # Inverse-distance weights
+    w = 1 / np.maximum(dist, 1e-12)
+    w /= w.sum(axis=1, keepdims=True)
+
+    return np.einsum('ij,ijk->ik', w, np.asarray(target)[ix])
+
+
+def solve_lsqr(A, b, x0, precision=1e-07, dx0=None):
+    """Solve ``A * x = b`` column-by-column using LSQR.
+
+    Parameters
+    ----------
+    A :         sparse matrix
+    b :         (M, 3) numpy array
+    x0 :        (N, 3) numpy array
+                Initial estimate (i.e. the current vertex positions).
+    precision : float
+                Passed to ``lsqr`` as ``atol`` and ``btol``.
+    dx0 :       (N, 3) numpy array, optional
+                Initial guess for the correction ``x - x0`` (e.g. from a
+                previous iteration). See ``_solve_warm``.
+
+    Returns
+    -------
+    x :         (N, 3) numpy array
+
+    """
+    if dx0 is not None:
+        return _solve_warm(lsqr, A, b, x0, dx0, precision)
+
+    x = np.zeros((A.shape[1], 3), dtype=x0.dtype)
+    for j in range(3):
+        """
+        # Solve A*x = b
+        # Note that we force scipy's lsqr() to use current vertex
+        # positions as start points - this speeds things up and
+        # without it we get suboptimal solutions that lead to early
+        # termination
+        x[:, j] = lsqr(A, b[:, j],
+                       atol=precision, btol=precision,
+                       damp=1,
+                       x0=x0[:, j])[0]
+        """
+        # The solution below is recommended in scipy's lsqr docstring
+        # for when we have an initial estimate
+        # Gives use the same results as above but is slightly faster
+
+        # Compute residual vector
+        r0 = b[:, j] - A * x0[:, j]
+        # Use LSQR to solve the system
+        dx = lsqr(A, r0,
+                  atol=precision, btol=precision,
+                  damp=1)[0]
+        # Add the correction dx to obtain a final solution
+        x[:, j] = x0[:, j] + dx
+
+    return x
+
+
+def solve_lsmr(A, b, x0, precision=1e-07, dx0=None):
+    """Solve ``A * x = b`` column-by-column using LSMR.
+
+    Same as ``solve_lsqr`` but using ``scipy.sparse.linalg.lsmr``.
+
+    Parameters
+    ----------
+    A :         sparse matrix
+    b :         (M, 3) numpy array
+    x0 :        (N, 3) numpy array
+                Initial estimate (i.e. the current vertex positions).
+    precision : float
+                Passed to ``lsmr`` as ``atol`` and ``btol``.
+    dx0 :       (N, 3) numpy array, optional
+                Initial guess for the correction ``x - x0``.
+
+    Returns
+    -------
+    x :         (N, 3) numpy array
+
+    """
+    if dx0 is not None:
+        return _solve_warm(lsmr, A, b, x0, dx0, precision)
+
+    x = np.zeros((A.shape[1], 3), dtype=x0.dtype)
+    for j in range(3):
+        r0 = b[:, j] - A @ x0[:, j]
+        dx = lsmr(A, r0, atol=precision, btol=precision, damp=1)[0]
+        x[:, j] = x0[:, j] + dx
+
+    return x
+
+
+def _solve_warm(func, A, b, x0, dx0, precision):
+    """Solve damped least-square problem for correction starting from ``dx0``.
+
+    We want ``dx`` that minimizes ``|A * dx - r0|^2 + |dx|^2`` with
+    ``r0 = b - A * x0``. Simply passing ``dx0`` as ``x0`` to ``lsqr``/``lsmr``
+    would change the problem: the damping would then apply to ``dx - dx0``
+    instead of ``dx``. Instead, we write the damping explicitly as
+    ``[A; I] * dx = [r0; 0]`` and solve that (undamped) for the remaining
+    correction ``dx - dx0``.
+    """
+    n = A.shape[1]
+    A_aug = sp.sparse.vstack([A, sp.sparse.identity(n, dtype=A.dtype)]).tocsr()
+
+    x = np.zeros((n, 3), dtype=x0.dtype)
+    for j in range(3):
+        r0 = b[:, j] - A @ x0[:, j]
+
+        # The previous correction is typically a good direction but its
+        # magnitude is off (contraction weights change between iterations):
+        # start from the optimal step along it instead
+        Adx0 = A @ dx0[:, j]
+        denom = Adx0 @ Adx0 + dx0[:, j] @ dx0[:, j]
+        alpha = (Adx0 @ r0) / denom if denom > 0 else 0
+        start = alpha * dx0[:, j]
+
+        r_aug = np.concatenate((r0 - alpha * Adx0, -start))
+
+        # LSQR/LSMR's first stopping criterion (``btol``) is relative to the
+        # norm of the right-hand side - rescale so that we stop at the same
+        # absolute residual as we would when starting from scratch. The
+        # second one (``atol``) compares the normal equations' residual to
+        # the current residual: that is the same for both systems and must
+        # not be rescaled or we stop short of the cold-start solution
+        scale = np.linalg.norm(r0) / max(np.linalg.norm(r_aug), 1e-300)
+        btol = min(precision * scale, 0.1)
+
+        ddx = func(A_aug, r_aug, atol=precision, btol=btol)[0]
+        x[:, j] = x0[:, j] + start + ddx
+
+    return x
+
+
+def solve_cholesky(A, b, x0):
+    """Solve ``A * x = b`` for all columns via the normal equations.
+
+    This solves the same damped least-square problem as ``solve_lsqr`` (i.e.
+    ``min |A * dx - r0|^2 + |dx|^2`` with ``r0 = b - A * x0``) but does so
+    exactly by factorizing ``A.T * A + I`` once and then solving for all
+    three right-hand sides against that one factorization.
+
+    Parameters
+    ----------
+    A :         sparse matrix
+    b :         (M, 3) numpy array
+    x0 :        (N, 3) numpy array
+                Initial estimate (i.e. the current vertex positions).
+
+    Returns
+    -------
+    x :         (N, 3) numpy array
+
+    """
+    x0 = np.asarray(x0)
+
+    # Always factorize in (at least) float64: the normal equations square the
+    # condition number of the system
+    dtype = np.result_type(x0, np.float64)
+    A = A.tocsr().astype(dtype, copy=False)
+
+    # Residuals for all three coordinates at once
+    r0 = b - A @ x0.astype(dtype, copy=False)
+
+    # Normal equations incl. the damping term (damp=1 in the LSQR path)
+    AtA = (A.T @ A + sp.sparse.identity(A.shape[1], format='csr')).tocsc()
+    Atr = A.T @ r0
+
+    if cholesky:
+        dx = cholesky(AtA)(Atr)
+    else:
+        # AtA is symmetric so we can use a symmetric column ordering
+        dx = splu(AtA, permc_spec='MMD_AT_PLUS_A').solve(Atr)
 
-        return dm
+    return (x0 + dx).astype(x0.dtype, copy=False)
@@ -0,0 +1,513 @@
+#    This script is part of skeletor (http://www.github.com/schlegelp/skeletor).
+#    Copyright (C) 2018 Philipp Schlegel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.
+
+"""Run the full pipeline (contract -> skeletonize -> clean -> radii) on many
+meshes."""
+
+import glob
+import os
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+import trimesh as tm
+
+from tqdm.auto import tqdm
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+except BaseException:
+    raise
+
+from .meshcontraction import contract
+from .postprocessing import clean
+from .profiling import Profiler, stage
+from .radiusextraction import radii
+from .skeleton import Skeleton
+from .skeletonizers import skeletonize
+from .utilities import make_trimesh, run_jobs
+
+__all__ = ['batch', 'skeletonize_dir', 'iter_meshes', 'write_swc']
+
+# File extensions picked up by `skeletonize_dir` by default
+MESH_EXTENSIONS = ('.ply', '.obj', '.stl', '.off', '.glb')
+
+
+def batch(meshes, skeletonize_kws, contract_kws=None, clean_kws=None,
+          radii_kws=None, n_jobs=-1, memory=False, progress=True):
+    """Skeletonize many meshes in parallel.
+
+    Runs ``contract`` -> ``skeletonize`` -> ``clean`` -> ``radii`` for each
+    mesh in a pool of processes. Meshes are passed to the worker processes via
+    shared memory instead of being pickled. Errors are caught and reported
+    per mesh, i.e. a failing mesh will not stop the batch.
+
+    Parameters
+    ----------
+    meshes :        iterable | dict
+                    The meshes to skeletonize. Each mesh can be::
+
+                      - a mesh-like object (see ``skeletonize``)
+                      - a filepath: the mesh will be loaded (via
+                        ``trimesh.load``) in the worker process
+                      - a callable (e.g. a ``functools.partial``) that loads
+                        and returns a mesh: will be called in the worker
+                        process and hence needs to be picklable
+
+                    If a dictionary, the keys are used as IDs for the results.
+                    Otherwise, results are identified by their index. Meshes
+                    are consumed lazily.
+    skeletonize_kws : dict
+                    Keyword arguments for ``skeletonize``. Must contain at
+                    least ``method``.
+    contract_kws :  dict | False, optional
+                    Keyword arguments for ``contract``. By default (None),
+                    will contract using default parameters. Set to False to
+                    skip contraction (e.g. if meshes are already contracted).
+    clean_kws :     dict, optional
+                    If provided, will clean the skeleton with these keyword
+                    arguments for ``clean``. Use ``{}`` for defaults.
+    radii_kws :     dict, optional
+                    If provided, will add radii with these keyword arguments
+                    for ``radii``. Use ``{}`` for defaults.
+    n_jobs :        int
+                    Number of processes. -1 (default) for all available cores.
+                    If 1, will process meshes sequentially in the current
+                    process.
+    memory :        bool
+                    If True, will trace memory allocations to report each
+                    stage's peak memory. Note that this has a noticeable
+                    overhead.
+    progress :      bool
+                    If True, will show a progress bar. Progress bars of the
+                    individual stages are always disabled.
+
+    Yields
+    ------
+    dict
+                    One per mesh, in order of completion::
+
+                      {'id': 0,           # index or key of the mesh
+                       'result': swc,     # output of the last stage or None
+                       'error': None,     # formatted traceback if failed
+                       'timings': {...},  # wall time in seconds per stage
+                       'peak_mem': ...,   # peak traced memory (or None)
+                       'max_rss': ...}    # max resident set size of the
+                                          # worker process in bytes
+
+    Examples
+    --------
+    >>> import skeletor as sk
+    >>> for res in sk.batch(meshes,
+    ...                     skeletonize_kws=dict(method='vertex_clusters',
+    ...                                          sampling_dist=100),
+    ...                     radii_kws={}):             # doctest: +SKIP
+    ...     if res['error']:
+    ...         print(res['id'], 'failed:', res['error'])
+    ...     else:
+    ...         res['result'].to_csv(f"{res['id']}.swc")
+
+    """
+    assert isinstance(skeletonize_kws, dict) and 'method' in skeletonize_kws
+    if clean_kws is not None or radii_kws is not None:
+        assert skeletonize_kws.get('output', 'swc') == 'swc', \
+            '`clean` and `radii` require skeletonize output "swc"'
+
+    if isinstance(meshes, dict):
+        items = meshes.items()
+    else:
+        items = enumerate(meshes)
+
+    total = len(meshes) if hasattr(meshes, '__len__') else None
+
+    params = dict(skeletonize_kws=skeletonize_kws,
+                  contract_kws=contract_kws,
+                  clean_kws=clean_kws,
+                  radii_kws=radii_kws,
+                  memory=memory)
+
+    # Only use shared memory if we actually send meshes to other processes
+    use_shm = shared_memory is not None and n_jobs not in (None, 1)
+
+    # Shared memory blocks by job ID - released once the job is done
+    blocks = {}
+
+    def make_jobs():
+        for k, mesh in items:
+            if isinstance(mesh, (str, os.PathLike)) or callable(mesh):
+                yield k, dict(source=mesh, **params)
+            elif use_shm:
+                try:
+                    mesh = make_trimesh(mesh, validate=False)
+                except Exception:
+                    # Let the worker fail (and report) on this mesh
+                    yield k, dict(source=mesh, **params)
+                    continue
+                blocks[k] = [_to_shared(mesh.vertices), _to_shared(mesh.faces)]
+                yield k, dict(shared=[b[1:] for b in blocks[k]], **params)
+            else:
+                yield k, dict(source=mesh, **params)
+
+    try:
+        for k, res in run_jobs(_process_mesh, make_jobs(), n_jobs=n_jobs,
+                               total=total, desc='Skeletonizing',
+                               progress=progress, catch=True):
+            for shm, *_ in blocks.pop(k, []):
+                shm.close()
+                shm.unlink()
+            # `_process_mesh` itself never raises but the job can still fail
+            # to reach the worker process (e.g. if it can't be pickled)
+            if isinstance(res, Exception):
+                res = {'result': None,
+                       'error': ''.join(traceback.format_exception(type(res), res,
+                                                                   res.__traceback__)),
+                       'timings': {}, 'peak_mem': None, 'max_rss': None}
+            yield {'id': k, **res}
+    finally:
+        # Clean up in case we got interrupted
+        for b in blocks.values():
+            for shm, *_ in b:
+                shm.close()
+                shm.unlink()
+
+
+def _to_shared(arr):
+    """Copy array into a new shared memory block.
+
+    Returns
+    -------
+    (SharedMemory, name, shape, dtype)
+
+    """
+    arr = np.ascontiguousarray(arr)
+    # Blocks must not be empty
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm, shm.name, arr.shape, arr.dtype.str
+
+
+def _from_shared(name, shape, dtype):
+    """Copy array out of an existing shared memory block."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.array(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    finally:
+        shm.close()
+
+
+def _process_mesh(skeletonize_kws, contract_kws, clean_kws, radii_kws,
+                  memory=False, source=None, shared=None):
+    """Run the pipeline on a single mesh.
+
+    The mesh is either given as ``source`` (mesh-like, filepath or loader)
+    or as ``shared`` ``[vertices, faces]`` shared memory descriptors.
+
+    Never raises: errors are returned as formatted traceback.
+    """
+    prof = Profiler(memory=memory)
+    res = {'result': None, 'error': None}
+    try:
+        with stage(prof, 'load'):
+            if shared is not None:
+                mesh = tm.Trimesh(vertices=_from_shared(*shared[0]),
+                                  faces=_from_shared(*shared[1]),
+                                  process=False)
+            elif isinstance(source, (str, os.PathLike)):
+                mesh = _load_mesh(source)
+            elif callable(source):
+                mesh = source()
+            else:
+                mesh = source
+            mesh = make_trimesh(mesh, validate=False)
+
+        cont = mesh
+        if contract_kws is not False:
+            cont = contract(mesh, profiler=prof,
+                            **{'progress': False, **(contract_kws or {})})
+
+        skel = skeletonize(cont, profiler=prof,
+                           **{'progress': False, **skeletonize_kws})
+
+        if clean_kws is not None:
+            skel = clean(skel, mesh, profiler=prof, **clean_kws)
+
+        if radii_kws is not None:
+            skel['radius'] = radii(skel, mesh, profiler=prof, **radii_kws)
+
+        res['result'] = skel
+    except Exception:
+        res['error'] = traceback.format_exc()
+
+    # Report top-level stages only
+    events = [e for e in prof.events if e['parent'] is None]
+    peaks = [e['peak_mem'] for e in events if e['peak_mem'] is not None]
+    res['timings'] = {e['stage']: e['wall'] for e in events}
+    res['peak_mem'] = max(peaks) if peaks else None
+    res['max_rss'] = events[-1]['max_rss'] if events else None
+
+    return res
+
+
+def skeletonize_dir(source, target, skeletonize_kws, contract_kws=None,
+                    clean_kws=None, radii_kws=None, extensions=MESH_EXTENSIONS,
+                    skip_existing=False, prefetch=2, n_jobs=1, memory=False,
+                    progress=True):
+    """Skeletonize meshes from files and write the results to SWC files.
+
+    Files are processed as a stream: meshes are loaded lazily, skeletons
+    are written as soon as they are ready and each mesh is released right
+    after. Memory use is therefore independent of the number of files.
+
+    Parameters
+    ----------
+    source :        str | iterable
+                    Either a directory (all files with matching extensions
+                    will be processed), a glob pattern (e.g.
+                    ``"meshes/*.ply"``) or an iterable of filepaths.
+    target :        str
+                    Directory to write SWC files to. Will be created if it
+                    does not exist. SWC files are named after the mesh files,
+                    e.g. ``123.ply`` -> ``123.swc``.
+    skeletonize_kws, contract_kws, clean_kws, radii_kws
+                    Parameters for the individual stages. See ``batch``.
+    extensions :    iterable of str
+                    If ``source`` is a directory, only files with these
+                    extensions are processed.
+    skip_existing : bool
+                    If True, will skip meshes for which a SWC file already
+                    exists in ``target``.
+    prefetch :      int
+                    Number of meshes to load ahead in a background thread
+                    while the current one is processed. Only relevant if
+                    ``n_jobs=1``: with multiple processes, each worker loads
+                    its own mesh.
+    n_jobs :        int
+                    Number of processes. See ``batch``.
+    memory :        bool
+                    If True, will trace memory allocations. See ``batch``.
+    progress :      bool
+                    If True, will show a progress bar.
+
+    Yields
+    ------
+    dict
+                    One per mesh, in order of completion. Same as for
+                    ``batch`` except that instead of the skeleton itself
+                    (``result``) it contains the path to the SWC file
+                    (``output``, None if failed). Skipped files are not
+                    reported.
+
+    Raises
+    ------
+    ValueError
+                    If two mesh files would write to the same SWC file (e.g.
+                    ``123.ply`` and ``123.obj``). This is checked before any
+                    mesh is processed.
+
+    Examples
+    --------
+    >>> import skeletor as sk
+    >>> for res in sk.pipeline.skeletonize_dir('meshes/', 'skeletons/',
+    ...                                        dict(method='vertex_clusters',
+    ...                                             sampling_dist=100)
+    ...                                        ):          # doctest: +SKIP
+    ...     if res['error']:
+    ...         print(res['id'], 'failed')
+
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.isdir(source):
+            files = sorted(os.path.join(source, f) for f in os.listdir(source)
+                           if f.lower().endswith(tuple(extensions)))
+        else:
+            files = sorted(glob.glob(str(source)))
+    else:
+        files = list(source)
+
+    # Drop files that were given more than once
+    files = list({os.path.abspath(f): f for f in files}.values())
+
+    def swc_path(f):
+        return os.path.join(target, os.path.splitext(os.path.basename(f))[0] + '.swc')
+
+    # Files with the same name (e.g. "a.ply" and "a.obj" or from different
+    # directories) would overwrite each other's SWC file
+    targets = {}
+    for f in files:
+        targets.setdefault(swc_path(f), []).append(f)
+    clashes = [fs for fs in targets.values() if len(fs) > 1]
+    if clashes:
+        raise ValueError('Mesh files must have unique names but some would '
+                         'write to the same SWC file: '
+                         + '; '.join(', '.join(map(str, fs)) for fs in clashes))
+
+    os.makedirs(target, exist_ok=True)
+
+    if skip_existing:
+        files = [f for f in files if not os.path.exists(swc_path(f))]
+
+    params = dict(skeletonize_kws=skeletonize_kws,
+                  contract_kws=contract_kws,
+                  clean_kws=clean_kws,
+                  radii_kws=radii_kws,
+                  memory=memory)
+
+    if n_jobs in (None, 1):
+        results = _stream(files, prefetch=prefetch, progress=progress, **params)
+    else:
+        results = batch({f: f for f in files}, n_jobs=n_jobs,
+                        progress=progress, **params)
+
+    # Not a generator itself so that the checks above run immediately
+    return _write_results(results, swc_path)
+
+
+def _write_results(results, swc_path):
+    """Write skeletons to SWC files as they come in."""
+    for res in results:
+        skel = res.pop('result')
+        res['output'] = None
+        if skel is not None:
+            try:
+                if isinstance(skel, Skeleton):
+                    skel = skel.to_swc()
+                write_swc(skel, swc_path(res['id']))
+                res['output'] = swc_path(res['id'])
+            except Exception:
+                res['error'] = traceback.format_exc()
+        # Make sure we don't hold on to the skeleton
+        del skel
+        yield res
+
+
+def _stream(files, prefetch=2, progress=True, **params):
+    """Process files sequentially while loading ahead in the background."""
+    with tqdm(total=len(files), desc='Skeletonizing',
+              disable=progress is False) as pbar:
+        for f, mesh, error, load_time in iter_meshes(files, prefetch=prefetch):
+            if error:
+                res = {'result': None, 'error': error, 'timings': {},
+                       'peak_mem': None, 'max_rss': None}
+            else:
+                res = _process_mesh(source=mesh, **params)
+            res['timings']['load'] = load_time
+            # Release the mesh before we move on
+            del mesh
+            pbar.update()
+            yield {'id': f, **res}
+
+
+def iter_meshes(files, prefetch=2):
+    """Lazily load meshes from files.
+
+    Parameters
+    ----------
+    files :     iterable
+                Filepaths to load.
+    prefetch :  int
+                Number of meshes to load ahead in a background thread. If 0,
+                meshes are loaded only when requested.
+
+    Yields
+    ------
+    (filepath, mesh, error, load time)
+                ``mesh`` is a ``trimesh.Trimesh`` or None if loading failed
+                in which case ``error`` is the formatted traceback.
+
+    """
+    if not prefetch:
+        for f in files:
+            yield (f, *_try_load(f))
+        return
+
+    q = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Don't block forever if the consumer went away
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def load():
+        for f in files:
+            if not put((f, *_try_load(f))):
+                return
+        put(done)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                break
+            yield item
+            # Drop our reference before waiting for the next mesh
+            del item
+    finally:
+        stop.set()
+
+
+def _try_load(f):
+    """Load mesh from file. Returns ``(mesh, error, load time)``."""
+    start = time.perf_counter()
+    try:
+        return _load_mesh(f), None, time.perf_counter() - start
+    except Exception:
+        return None, traceback.format_exc(), time.perf_counter() - start
+
+
+def _load_mesh(f):
+    """Load single mesh from file."""
+    return make_trimesh(tm.load(f, force='mesh'), validate=False)
+
+
+def write_swc(swc, filepath):
+    """Write SWC table to file.
+
+    Parameters
+    ----------
+    swc :       pandas.DataFrame
+                SWC table as generated by ``skeletonize``.
+    filepath :  str
+                File to write to. The file is written to a temporary file
+                first and then moved into place, i.e. there won't be partial
+                files if writing is interrupted.
+
+    """
+    swc = swc.copy()
+    swc['label'] = 0
+    swc['radius'] = swc.radius.fillna(0).astype(float)
+
+    tmp = f'{filepath}.tmp'
+    with open(tmp, 'w') as f:
+        f.write('# SWC generated by skeletor\n')
+        f.write('# node_id label x y z radius parent_id\n')
+        swc[['node_id', 'label', 'x', 'y', 'z', 'radius', 'parent_id']].to_csv(f,
+                                                                            sep=' ',
+                                                                            header=False,
+                                                                            index=False)
+    os.replace(tmp, filepath)
@@ -31,10 +31,11 @@ import numpy as np
 import pandas as pd
 import scipy.spatial
 
+from .profiling import stage
 from .utilities import make_trimesh
 
 
-def clean(swc, mesh, validate=False, copy=True, **kwargs):
+def clean(swc, mesh, validate=False, copy=True, profiler=None, **kwargs):
     """Clean up the skeleton.
 
     This function bundles a bunch of procedures to clean up the skeleton:
@@ -59,6 +60,9 @@ def clean(swc, mesh, validate=False, copy=True, **kwargs):
                 inplace!
     copy :      bool
                 If True will make and return a copy of the SWC table.
+    profiler :  callable, optional
+                If provided, will be called with timing/memory events for
+                this function and its sub-stages. See ``skeletor.profiling``.
 
     **kwargs
                 Keyword arguments are passed to the bundled function:
@@ -90,20 +94,25 @@ def clean(swc, mesh, validate=False, copy=True, **kwargs):
     if swc.empty:
         raise ValueError('SWC table is empty')
 
-    mesh = make_trimesh(mesh, validate=validate)
+    with stage(profiler, 'clean', n_nodes=len(swc)):
+        mesh = make_trimesh(mesh, validate=validate)
 
-    if copy:
-        swc = swc.copy()
+        if copy:
+            swc = swc.copy()
 
-    # Drop parallel twigs
-    swc = drop_parallel_twigs(swc, theta=kwargs.get('theta', 0.01), copy=False)
+        # Drop parallel twigs
+        with stage(profiler, 'clean.parallel_twigs'):
+            swc = drop_parallel_twigs(swc, theta=kwargs.get('theta', 0.01),
+                                      copy=False)
 
-    # Recenter vertices
-    swc = recenter_vertices(swc, mesh, copy=False)
+        # Recenter vertices
+        with stage(profiler, 'clean.recenter'):
+            swc = recenter_vertices(swc, mesh, copy=False)
 
-    # Collapse twigs that in line of sight to one another
-    swc = drop_line_of_sight_twigs(swc, mesh, copy=False,
-                                   max_dist=kwargs.get('max_dist', 'auto'))
+        # Collapse twigs that in line of sight to one another
+        with stage(profiler, 'clean.line_of_sight'):
+            swc = drop_line_of_sight_twigs(swc, mesh, copy=False,
+                                           max_dist=kwargs.get('max_dist', 'auto'))
 
     return swc
 
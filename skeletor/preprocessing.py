@@ -181,6 +181,63 @@ def remove_winglets(mesh):
     return mesh.submesh([fkeep])[0]
 
 
+def decimate(mesh, ratio, validate=True):
+    """Decimate mesh by clustering vertices on a regular grid.
+
+    This is a quick & dirty alternative to ``simplify`` that does not require
+    Blender and runs in linear time: all vertices within the same grid cell
+    are collapsed into a single vertex at their center. The resulting mesh
+    is not guaranteed to preserve the topology of the original mesh.
+
+    Parameters
+    ----------
+    mesh :      trimesh.Trimesh
+                Mesh to decimate.
+    ratio :     float
+                Approximate factor to which to reduce vertices. For example,
+                a ratio of 0.1 will produce a mesh with roughly 10% of the
+                original vertices.
+    validate :  bool
+                If True, will try to fix potential issues with the decimated
+                mesh (e.g. duplicate/degenerate faces, winglets).
+
+    Returns
+    -------
+    trimesh.Trimesh
+            Decimated mesh.
+
+    """
+    assert isinstance(mesh, tm.Trimesh)
+    assert ratio < 1 and ratio > 0, 'ratio must be between 0 and 1'
+
+    # Number of vertices on a surface scales with the inverse square of the
+    # edge length -> use that to pick a grid size
+    cell = mesh.edges_unique_length.mean() / np.sqrt(ratio)
+
+    # Assign each vertex to a grid cell
+    cells = np.floor((mesh.vertices - mesh.vertices.min(axis=0)) / cell).astype(np.int64)
+    _, labels, counts = np.unique(cells, axis=0, return_inverse=True,
+                                  return_counts=True)
+    labels = labels.flatten()
+
+    # New vertices are at the center of each cell's vertices
+    verts = np.stack([np.bincount(labels, weights=mesh.vertices[:, i]) / counts
+                      for i in range(3)], axis=1)
+
+    # Remap faces and drop those that collapsed
+    faces = labels[mesh.faces]
+    faces = faces[(faces[:, 0] != faces[:, 1])
+                  & (faces[:, 1] != faces[:, 2])
+                  & (faces[:, 0] != faces[:, 2])]
+
+    decimated = tm.Trimesh(vertices=verts, faces=faces)
+
+    if validate:
+        decimated = fix_mesh(decimated, inplace=True)
+
+    return decimated
+
+
 def simplify(mesh, ratio):
     """Simplify mesh using Blender 3D.
 
@@ -0,0 +1,211 @@
+#    This script is part of skeletor (http://www.github.com/schlegelp/skeletor).
+#    Copyright (C) 2018 Philipp Schlegel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.
+
+"""Instrumentation for the skeletonization pipeline.
+
+``contract``, ``skeletonize``, ``radii`` and ``clean`` accept a ``profiler``
+which can be any callable: it is called with one event (a dictionary) for
+each (sub-)stage that finishes. Events look like this::
+
+    {'stage': 'contract.solve',       # name of the (sub-)stage
+     'parent': 'contract',            # name of the enclosing stage (or None)
+     'wall': 0.0153,                  # wall time in seconds
+     'cpu': 0.0149,                   # CPU time (this process) in seconds
+     'peak_mem': 1838120,             # peak traced memory in bytes (or None)
+     'max_rss': 213057536,            # max resident set size in bytes (or None)
+     'iteration': 3}                  # any additional, stage-specific info
+
+``peak_mem`` is only available if ``tracemalloc`` is tracing (see
+``Profiler``). ``max_rss`` is the process' high water mark (as per
+``resource.getrusage``) and hence not specific to the stage.
+
+Examples
+--------
+>>> import skeletor as sk
+>>> prof = sk.profiling.Profiler(memory=True)
+>>> cont = sk.contract(mesh, profiler=prof)                 # doctest: +SKIP
+>>> swc = sk.skeletonize(cont, method='vertex_clusters',
+...                      sampling_dist=100, profiler=prof)  # doctest: +SKIP
+>>> prof.summary()                                          # doctest: +SKIP
+
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+except BaseException:
+    raise
+
+__all__ = ['Profiler', 'stage']
+
+# Stack of currently open stages (per thread)
+_local = threading.local()
+
+
+class Profiler:
+    """Collects events emitted by the pipeline's stages.
+
+    Parameters
+    ----------
+    memory :    bool
+                If True, will trace memory allocations (via ``tracemalloc``)
+                while the profiler is in use to measure each stage's peak
+                memory. Note that this has a noticeable overhead.
+    callback :  callable, optional
+                Will be called with each event in addition to collecting it.
+                Use this to e.g. stream events to a log.
+
+    Examples
+    --------
+    >>> import skeletor as sk
+    >>> prof = sk.profiling.Profiler()
+    >>> with sk.profiling.stage(prof, 'my_stage', foo=1):
+    ...     pass
+    >>> prof.events[0]['stage'], prof.events[0]['foo']
+    ('my_stage', 1)
+
+    """
+
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+        if self.callback:
+            self.callback(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    def to_frame(self):
+        """Return collected events as pandas DataFrame."""
+        return pd.DataFrame(self.events)
+
+    def summary(self):
+        """Summarize collected events by stage.
+
+        Returns
+        -------
+        pandas.DataFrame
+                Number of events, total wall and CPU time and max peak memory
+                per stage.
+
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        return df.groupby('stage').agg(n=('wall', 'size'),
+                                       wall=('wall', 'sum'),
+                                       cpu=('cpu', 'sum'),
+                                       peak_mem=('peak_mem', 'max'))
+
+    def clear(self):
+        """Drop all collected events."""
+        self.events = []
+
+
+@contextmanager
+def stage(profiler, name, **info):
+    """Time a (sub-)stage and report it to ``profiler``.
+
+    This is a no-op if ``profiler`` is ``None``.
+
+    Parameters
+    ----------
+    profiler :  callable | None
+                Will be called with the event (a dictionary) once the stage
+                finishes. See module docstring for the event's format.
+    name :      str
+                Name of the stage, e.g. "contract.solve".
+    **info
+                Additional information to add to the event. The context
+                manager yields the event dictionary so that information can
+                also be added from within the stage.
+
+    """
+    if profiler is None:
+        yield {}
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    # Start tracing memory if requested (and not already running)
+    started_tracing = False
+    if getattr(profiler, 'memory', False) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # Fold the peak so far into the enclosing stage before resetting it
+        _, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        # Before Python 3.9 peaks are measured since tracing started
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    event = {'stage': name,
+             'parent': stack[-1]['name'] if stack else None}
+    event.update(info)
+    stack.append({'name': name, 'peak': 0})
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield event
+    finally:
+        event['wall'] = time.perf_counter() - wall
+        event['cpu'] = time.process_time() - cpu
+
+        frame = stack.pop()
+        if tracing and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(frame['peak'], peak)
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            event['peak_mem'] = peak
+        else:
+            event['peak_mem'] = None
+
+        if started_tracing:
+            tracemalloc.stop()
+
+        event['max_rss'] = _max_rss()
+
+        profiler(event)
+
+
+def _max_rss():
+    """Return the process' max resident set size in bytes."""
+    if not resource:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
@@ -25,6 +25,7 @@ import numpy as np
 import pandas as pd
 import scipy.spatial
 
+from .profiling import stage
 from .utilities import make_trimesh
 
 try:
@@ -35,7 +36,8 @@ except BaseException:
     raise
 
 
-def radii(swc, mesh, method='knn', aggregate='mean', validate=False, **kwargs):
+def radii(swc, mesh, method='knn', aggregate='mean', validate=False,
+          profiler=None, **kwargs):
     """Extract radii for given skeleton table.
 
     Parameters
@@ -58,6 +60,9 @@ def radii(swc, mesh, method='knn', aggregate='mean', validate=False, **kwargs):
                 (e.g. infinite values, duplicate vertices, degenerate faces)
                 before skeletonization. Note that this might make changes to
                 your mesh inplace!
+    profiler :  callable, optional
+                If provided, will be called with timing/memory events for
+                this function. See ``skeletor.profiling``.
     **kwargs
                 Keyword arguments are passed to the respective method:
 
@@ -90,17 +95,20 @@ def radii(swc, mesh, method='knn', aggregate='mean', validate=False, **kwargs):
     if swc.empty:
         raise ValueError('SWC table is empty')
 
-    mesh = make_trimesh(mesh, validate=True)
-
-    if method == 'knn':
-        return get_radius_kkn(swc[['x', 'y', 'z']].values,
-                              mesh=mesh, **kwargs)
-    elif method == 'ray':
-        if not ncollpyde:
-            raise ImportError('Method "ray" requires the ncollpyde package.')
-        return get_radius_ray(swc, mesh=mesh, **kwargs)
-    else:
-        raise ValueError(f'Unknown method "{method}"')
+    with stage(profiler, 'radii', method=method, n_nodes=len(swc)):
+        mesh = make_trimesh(mesh, validate=True)
+
+        if method == 'knn':
+            with stage(profiler, 'radii.knn'):
+                return get_radius_kkn(swc[['x', 'y', 'z']].values,
+                                      mesh=mesh, **kwargs)
+        elif method == 'ray':
+            if not ncollpyde:
+                raise ImportError('Method "ray" requires the ncollpyde package.')
+            with stage(profiler, 'radii.ray_casting'):
+                return get_radius_ray(swc, mesh=mesh, **kwargs)
+        else:
+            raise ValueError(f'Unknown method "{method}"')
 
 
 def get_radius_kkn(coords, mesh, n=5, aggregate='mean'):
@@ -0,0 +1,217 @@
+#    This script is part of skeletor (http://www.github.com/schlegelp/skeletor).
+#    Copyright (C) 2018 Philipp Schlegel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+__all__ = ['Skeleton']
+
+
+class Skeleton:
+    """Compact, array-backed representation of a skeleton.
+
+    This is what ``skeletonize(..., output='skeleton')`` returns. Nodes are
+    referred to by their index (0 to N-1) in the arrays; conversion to an
+    SWC table or a networkx graph only happens when asked for.
+
+    Parameters
+    ----------
+    parents :   (N, ) array of int
+                Index (not ID) of each node's parent. Roots have parent -1.
+    coords :    (N, 3) array of float
+                x/y/z coordinates of each node.
+    radius :    (N, ) array of float, optional
+                Radius of each node. Defaults to NaN (i.e. unknown).
+    node_ids :  (N, ) array of int, optional
+                IDs of the nodes as used in SWC table and graph, e.g. the
+                corresponding vertex IDs in the mesh. Defaults to the nodes'
+                indices.
+    vertex_ids : (N, ) array of int, optional
+                If provided, maps each node to a vertex in the original mesh
+                and will be added as "vertex_id" column to the SWC table.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from skeletor.skeleton import Skeleton
+    >>> s = Skeleton([-1, 0, 0, 1], np.zeros((4, 3)))
+    >>> s.roots
+    array([0])
+    >>> s.children(0)
+    array([1, 2])
+    >>> s.to_swc().parent_id.tolist()
+    [-1, 0, 0, 1]
+
+    """
+
+    __slots__ = ('parents', 'coords', 'radius', 'node_ids', 'vertex_ids',
+                 '_child_indptr', '_child_indices')
+
+    def __init__(self, parents, coords, radius=None, node_ids=None,
+                 vertex_ids=None):
+        self.parents = np.asarray(parents, dtype=int)
+        self.coords = np.asarray(coords).reshape(-1, 3)
+
+        assert self.parents.ndim == 1
+        assert self.coords.shape[0] == self.parents.shape[0]
+
+        if radius is None:
+            radius = np.full(self.n_nodes, np.nan)
+        self.radius = np.asarray(radius, dtype=float)
+
+        if node_ids is None:
+            node_ids = np.arange(self.n_nodes)
+        self.node_ids = np.asarray(node_ids, dtype=int)
+
+        if vertex_ids is not None:
+            vertex_ids = np.asarray(vertex_ids, dtype=int)
+        self.vertex_ids = vertex_ids
+
+        assert self.radius.shape == self.parents.shape
+        assert self.node_ids.shape == self.parents.shape
+
+        self._child_indptr = None
+        self._child_indices = None
+
+    @classmethod
+    def from_edges(cls, edges, coords, **kwargs):
+        """Generate skeleton from child -> parent edges.
+
+        Parameters
+        ----------
+        edges :     (N, 2) array of int
+                    ``(node_id, parent_id)`` for each node. Roots have
+                    parent ID -1.
+        coords :    (M, 3) array of float
+                    Coordinates indexed by node ID, e.g. mesh vertices.
+        **kwargs
+                    Passed to ``Skeleton``.
+
+        """
+        edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+        node_ids = edges[:, 0]
+
+        srt = np.argsort(node_ids)
+        has_parent = edges[:, 1] >= 0
+        parents = np.full(len(node_ids), -1)
+        parents[has_parent] = srt[np.searchsorted(node_ids, edges[has_parent, 1],
+                                                  sorter=srt)]
+
+        return cls(parents, np.asarray(coords)[node_ids], node_ids=node_ids,
+                   **kwargs)
+
+    def __len__(self):
+        return self.n_nodes
+
+    def __repr__(self):
+        return f'<Skeleton(nodes={self.n_nodes}, roots={len(self.roots)})>'
+
+    @property
+    def n_nodes(self):
+        """Number of nodes."""
+        return self.parents.shape[0]
+
+    @property
+    def roots(self):
+        """Indices of root nodes."""
+        return np.where(self.parents < 0)[0]
+
+    @property
+    def edges(self):
+        """(M, 2) array of child -> parent edges (by index)."""
+        is_child = self.parents >= 0
+        return np.array([np.where(is_child)[0], self.parents[is_child]]).T
+
+    @property
+    def child_indptr(self):
+        """CSR-style index pointer into ``child_indices``."""
+        if self._child_indptr is None:
+            self._build_child_index()
+        return self._child_indptr
+
+    @property
+    def child_indices(self):
+        """Indices of child nodes, grouped by parent. See ``children``."""
+        if self._child_indices is None:
+            self._build_child_index()
+        return self._child_indices
+
+    def _build_child_index(self):
+        """Generate CSR-style index of each node's children."""
+        is_child = self.parents >= 0
+        counts = np.bincount(self.parents[is_child], minlength=self.n_nodes)
+        self._child_indptr = np.append(0, np.cumsum(counts))
+        srt = np.argsort(self.parents, kind='stable')
+        self._child_indices = srt[self.parents[srt] >= 0]
+
+    def children(self, node):
+        """Return indices of the children of a given node (by index)."""
+        return self.child_indices[self.child_indptr[node]:self.child_indptr[node + 1]]
+
+    def to_swc(self):
+        """Generate SWC table.
+
+        Returns
+        -------
+        SWC table : pandas.DataFrame
+                    Same format as the tables returned by ``skeletonize``.
+
+        """
+        is_child = self.parents >= 0
+        parent_ids = np.full(self.n_nodes, -1)
+        parent_ids[is_child] = self.node_ids[self.parents[is_child]]
+
+        swc = pd.DataFrame({'node_id': self.node_ids,
+                            'parent_id': parent_ids,
+                            'x': self.coords[:, 0],
+                            'y': self.coords[:, 1],
+                            'z': self.coords[:, 2]})
+
+        # Placeholder radius if unknown
+        if np.any(np.isfinite(self.radius)):
+            swc['radius'] = self.radius
+        else:
+            swc['radius'] = None
+
+        if self.vertex_ids is not None:
+            swc['vertex_id'] = self.vertex_ids
+
+        return swc.sort_values('parent_id').reset_index(drop=True)
+
+    def to_networkx(self):
+        """Generate directed graph.
+
+        Returns
+        -------
+        networkx.DiGraph
+                    Nodes have x/y/z coordinates as attributes and edges
+                    (child -> parent) are weighted by their length.
+
+        """
+        G = nx.DiGraph()
+        G.add_nodes_from([(n, {'x': co[0], 'y': co[1], 'z': co[2]})
+                          for n, co in zip(self.node_ids.tolist(),
+                                           self.coords.tolist())])
+
+        edges = self.edges
+        weights = np.sqrt(np.sum((self.coords[edges[:, 0]] - self.coords[edges[:, 1]]) ** 2,
+                                 axis=1))
+        G.add_weighted_edges_from(zip(self.node_ids[edges[:, 0]].tolist(),
+                                      self.node_ids[edges[:, 1]].tolist(),
+                                      weights.tolist()))
+
+        return G
@@ -16,27 +16,25 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.
 
-try:
-    import fastremap
-except ImportError:
-    fastremap = None
-except BaseException:
-    raise
+import heapq
+import time
 
 import networkx as nx
 import numpy as np
 import pandas as pd
 import trimesh as tm
 import scipy.sparse
-import scipy.spatial
+import scipy.sparse.csgraph
 
 from tqdm.auto import tqdm
 
+from .profiling import stage
+from .skeleton import Skeleton
 from .utilities import make_trimesh
 
 
 def skeletonize(mesh, method, output='swc', progress=True, validate=False,
-                drop_disconnected=False, **kwargs):
+                drop_disconnected=False, dtype=None, profiler=None, **kwargs):
     """Skeletonize a (contracted) mesh.
 
     Parameters
@@ -60,7 +58,7 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
                        scale well but is really good at preserving topology.
                        See ``skeletor.skeletonizers.by_edge_collapse`` for
                        details.
-    output :        "swc" | "graph" | "both"
+    output :        "swc" | "graph" | "both" | "skeleton"
                     Determines the function's output. See ``Returns``.
     progress :      bool
                     If True, will show progress bar.
@@ -72,6 +70,15 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
     drop_disconnected : bool
                     If True, will drop disconnected nodes from the skeleton.
                     Note that this might result in empty skeletons.
+    dtype :         "float32" | "float64", optional
+                    Working precision for vertex coordinates, edge lengths
+                    and costs. Use float32 to save memory on large meshes.
+                    By default uses float64 (and extended precision for the
+                    shape cost matrices of ``edge_collapse``).
+    profiler :      callable, optional
+                    If provided, will be called with timing/memory events for
+                    this function and its sub-stages. See
+                    ``skeletor.profiling``.
 
     **kwargs
                     Keyword arguments are passed to the above mentioned
@@ -79,10 +86,11 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
 
     For method "vertex_clusters":
 
-    sampling_dist : float | int, required
+    sampling_dist : float | int | list thereof, required
                     Maximal distance at which vertices are clustered. This
                     parameter should be tuned based on the resolution of your
-                    mesh.
+                    mesh. If a list, will return a list with one skeleton
+                    per sampling distance.
     cluster_pos :   "median" | "center"
                     How to determine the x/y/z coordinates of the collapsed
                     vertex clusters (i.e. the skeleton's nodes)::
@@ -91,6 +99,10 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
                         mass.
                       - "center": Use the center of mass. This makes for smoother
                         skeletons but can lead to nodes outside the mesh.
+    clustering :    "dfs" | "geodesic"
+                    How to group vertices: "dfs" (default) is a fast depth
+                    first traversal, "geodesic" makes compact geodesic
+                    Voronoi clusters around farthest-point seeds.
 
     For method "edge_collapse":
 
@@ -100,6 +112,13 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
     sample_weight : float, default = 0.1
                     Weight for sampling costs which penalize collapses that
                     would generate prohibitively long edges.
+    target_nodes :  int, optional
+                    Stop collapsing edges once this many vertices are left.
+    max_cost :      float, optional
+                    Stop collapsing edges once the cheapest collapse costs
+                    more than this.
+    time_budget :   float, optional
+                    Stop collapsing edges after this many seconds.
 
     Returns
     -------
@@ -109,6 +128,11 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
                     Graph representation of the skeleton.
     "both" :        tuple
                     Both of the above: ``(swc, graph)``.
+    "skeleton" :    skeletor.skeleton.Skeleton
+                    Compact, array-based representation of the skeleton.
+                    Skips generating graph and SWC table and is hence much
+                    faster for large skeletons. Use its ``.to_swc()`` and
+                    ``.to_networkx()`` methods for conversion.
 
     References
     ----------
@@ -116,8 +140,6 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
         contraction. ACM Transactions on Graphics (TOG). 2008 Aug 1;27(3):44.
 
     """
-    mesh = make_trimesh(mesh, validate=validate)
-
     assert method in ['vertex_clusters', 'edge_collapse']
     required_param = {'vertex_clusters': ['sampling_dist'],
                       'edge_collapse': []}
@@ -126,17 +148,24 @@ def skeletonize(mesh, method, output='swc', progress=True, validate=False,
         if kw not in kwargs:
             raise ValueError(f'Method "{method}" requires parameter "{kw}" - see help(skeletor.skeletonize)')
 
-    if method == 'vertex_clusters':
-        return by_vertex_clusters(mesh, output=output, progress=progress,
-                                  drop_disconnected=drop_disconnected, **kwargs)
+    with stage(profiler, 'skeletonize', method=method):
+        mesh = make_trimesh(mesh, validate=validate)
+
+        if method == 'vertex_clusters':
+            return by_vertex_clusters(mesh, output=output, progress=progress,
+                                      drop_disconnected=drop_disconnected,
+                                      dtype=dtype, profiler=profiler, **kwargs)
 
-    if method == 'edge_collapse':
-        return by_edge_collapse(mesh, output=output, progress=progress,
-                                drop_disconnected=drop_disconnected, **kwargs)
+        if method == 'edge_collapse':
+            return by_edge_collapse(mesh, output=output, progress=progress,
+                                    drop_disconnected=drop_disconnected,
+                                    dtype=dtype, profiler=profiler, **kwargs)
 
 
 def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
-                     drop_disconnected=False, progress=True):
+                     drop_disconnected=False, progress=True, dtype=None,
+                     target_nodes=None, max_cost=None, time_budget=None,
+                     profiler=None):
     """Skeletonize a (contracted) mesh by collapsing edges.
 
     Notes
@@ -151,6 +180,11 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     you might get skeletons that don't quite match the mesh (e.g. too few nodes).
     If you experience either, try down- or up-scaling your mesh, respectively.
 
+    The edge collapse can be stopped early via ``target_nodes``, ``max_cost``
+    and/or ``time_budget``. In that case, the skeleton is made from the
+    vertices remaining at that point (i.e. it will be coarser where the mesh
+    has not yet been fully collapsed).
+
     Parameters
     ----------
     mesh :          mesh obj
@@ -164,13 +198,32 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     sample_weight : float, optional
                     Weight for sampling costs which penalize collapses that
                     would generate prohibitively long edges.
-    output :        "swc" | "graph" | "both"
+    output :        "swc" | "graph" | "both" | "skeleton"
                     Determines the function's output. See ``Returns``.
     drop_disconnected : bool
                     If True, will drop disconnected nodes from the skeleton.
                     Note that this might result in empty skeletons.
     progress :      bool
                     If True, will show progress bar.
+    dtype :         "float32" | "float64", optional
+                    Working precision for coordinates, edge lengths and
+                    costs. The shape cost matrices (Q) are accumulated
+                    over many collapses and are hence kept in (at least)
+                    float64. By default (None), uses float64 and extended
+                    precision (float128) for the shape cost matrices.
+    target_nodes :  int, optional
+                    If provided, will stop collapsing edges once the number
+                    of remaining vertices drops to this number.
+    max_cost :      float, optional
+                    If provided, will stop collapsing edges once the cheapest
+                    remaining collapse costs more than this.
+    time_budget :   float, optional
+                    Time (in seconds) after which to stop collapsing edges.
+                    Note that this does not include extracting the skeleton
+                    from the collapsed mesh afterwards.
+    profiler :      callable, optional
+                    If provided, will be called with timing/memory events for
+                    sub-stages. See ``skeletor.profiling``.
 
     Returns
     -------
@@ -180,6 +233,11 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
                     Graph representation of the skeleton.
     "both" :        tuple
                     Both of the above: ``(swc, graph)``.
+    "skeleton" :    skeletor.skeleton.Skeleton
+                    Compact, array-based representation of the skeleton.
+                    Skips generating graph and SWC table and is hence much
+                    faster for large skeletons. Use its ``.to_swc()`` and
+                    ``.to_networkx()`` methods for conversion.
 
     References
     ----------
@@ -187,7 +245,9 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
         contraction. ACM Transactions on Graphics (TOG). 2008 Aug 1;27(3):44.
 
     """
-    assert output in ['swc', 'graph', 'both']
+    assert output in ['swc', 'graph', 'both', 'skeleton']
+    assert target_nodes is None or target_nodes >= 1
+    assert time_budget is None or time_budget >= 0
 
     mesh = make_trimesh(mesh, validate=False)
 
@@ -195,7 +255,7 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     # We convert to arrays to (a) make a copy and (b) remove potential overhead
     # from these originally being trimesh TrackedArrays
     edges = np.array(mesh.edges_unique)
-    verts = np.array(mesh.vertices)
+    verts = np.array(mesh.vertices, dtype=dtype)
 
     # For cost calculations we will normalise coordinates
     # This prevents getting ridiculuously large cost values ?e300
@@ -242,34 +302,19 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     K = np.array(K)
 
     # Q for vertex i is then the sum of the products of (kT,k) for ALL edges
-    # connected to vertex i:
-    # Initialize matrix of correct shape
-    Q_array = np.zeros((4, 4, verts.shape[0]), dtype=np.float128)
-
-    # Generate (kT, K)
-    kT = np.transpose(K, axes=(1, 0, 2))
-
-    # To get the sum of the products in the correct format we have to
-    # do some annoying transposes to get to (4, 4, len(edges))
-    K_dot = np.matmul(K.T, kT.T).T
-
-    # Iterate over all vertices
-    for v in range(len(verts)):
-        # Find edges that contain this vertex
-        cond1 = edges[:, 0] == v
-        cond2 = edges[:, 1] == v
-        # Note that this does not take directionality of edges into account
-        # Not sure if that's intended?
-
-        # Get indices of these edges
-        indices = np.where(cond1 | cond2)[0]
-
-        # Get the products for all edges adjacent to mesh
-        Q = K_dot[:, :, indices]
-        # Sum over all edges
-        Q = Q.sum(axis=2)
-        # Add to Q array
-        Q_array[:, :, v] = Q
+    # connected to vertex i. Since Q is symmetric, we only store its upper
+    # triangle (10 unique values) - see ``_Q_TRIU``
+    K_dot = np.einsum('rme,rne->emn', K, K)[:, _Q_TRIU[0], _Q_TRIU[1]]
+
+    # Sum over the edges connected to each vertex via a sparse
+    # (vertex x edge) incidence matrix. Note that this does not take
+    # directionality of edges into account - not sure if that's intended?
+    incidence = scipy.sparse.csr_matrix((np.ones(edges.size),
+                                         (edges.T.flatten(),
+                                          np.tile(np.arange(edges.shape[0]), 2))),
+                                        shape=(verts.shape[0], edges.shape[0]))
+    Q_array = np.asarray(incidence @ K_dot,
+                         dtype=np.float128 if dtype is None else np.float64)
 
     # Not sure if we are doing something wrong when calculating the Q array but
     # we end up having negative values which translate into negative scores.
@@ -303,15 +348,8 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     w = 1
     p = np.append(p, np.full((p.shape[0], 1), w), axis=1)
 
-    this_Q1 = Q_array[:, :, edges[:, 0]]
-    this_Q2 = Q_array[:, :, edges[:, 1]]
-
-    F1 = np.einsum('ij,kji->ij', p, this_Q1)[:, [0, 1]]
-    F2 = np.einsum('ij,kji->ij', p, this_Q2)[:, [0, 1]]
-
-    # Calculate and append shape cost
-    F = np.append(F1, F2, axis=1)
-    shape_cost = np.sum(F, axis=1)
+    # Calculate shape cost
+    shape_cost = _shape_cost(p, p, Q_array[edges[:, 0]], Q_array[edges[:, 1]])
 
     # Sum lengths of all edges associated with a given vertex
     # This is easiest by generating a sparse matrix from the edges
@@ -345,46 +383,81 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     face_count = face_edges.shape[0]  # keep track of face counts for progress bar
     is_collapsed = np.full(edges.shape[0], False)
     keep = np.full(edges.shape[0], False)
-    with tqdm(desc='Collapsing edges', total=face_count, disable=progress is False) as pbar:
-        while face_edges.size:
-            # Uncomment to get a more-or-less random edge collapse
-            # F_T[:] = 0
 
+    # Edges are picked from a priority queue of (cost, edge index) tuples.
+    # Instead of removing outdated entries when costs change, we push the
+    # new cost and skip entries that don't match the current cost when they
+    # come up ("lazy invalidation")
+    heap = list(zip(_heap_keys(F_T), range(len(F_T))))
+    heapq.heapify(heap)
+
+    # Instead of relabelling vertices and edges across the whole mesh after
+    # each collapse, we track things locally:
+    # 1. Merged vertices are tracked via a union-find: `edges` keeps the
+    #    original vertex IDs and `_find(parent, edges)` gives the current ones
+    # 2. For each (current) vertex the edges it is part of
+    # 3. For each edge the (remaining) faces it is part of
+    parent = np.arange(verts.shape[0])
+    vert_edges = [set() for _ in range(verts.shape[0])]
+    for e, (i, j) in enumerate(edges.tolist()):
+        vert_edges[i].add(e)
+        vert_edges[j].add(e)
+    edge_faces = [set() for _ in range(edges.shape[0])]
+    for f, row in enumerate(face_edges.tolist()):
+        for e in row:
+            edge_faces[e].add(f)
+    is_alive = np.full(face_edges.shape[0], True)
+    n_alive = face_edges.shape[0]
+
+    # Track the number of remaining vertices for early stopping
+    n_nodes = np.unique(edges).shape[0]
+    stopped_early = False
+    start = time.time()
+
+    with tqdm(desc='Collapsing edges', total=face_count, disable=progress is False) as pbar, \
+         stage(profiler, 'skeletonize.edge_collapse'):
+        while n_alive:
             # Update progress bar
-            pbar.update(face_count - face_edges.shape[0])
-            face_count = face_edges.shape[0]
-
-            # This has to come at the beginning of the loop
-            # Set cost of collapsing edges without faces to infinite
-            F_T[keep] = np.inf
-            F_T[is_collapsed] = np.inf
-
-            # Get the edge that we want to collapse
-            collapse_ix = np.argmin(F_T)
-            # Get the vertices this edge connects
-            u, v = edges[collapse_ix]
-            # Get all edges that contain these vertices:
-            # First, edges that are (uv, x)
-            connects_uv = np.isin(edges[:, 0], [u, v])
-            # Second, check if any (uv, x) edges are (uv, uv)
-            connects_uv[connects_uv] = np.isin(edges[connects_uv, 1], [u, v])
-
-            # Remove uu and vv edges
-            uuvv = edges[:, 0] == edges[:, 1]
-            connects_uv = connects_uv & ~uuvv
-            # Get the edge's indices
-            clps_edges = np.where(connects_uv)[0]
+            pbar.update(face_count - n_alive)
+            face_count = n_alive
+
+            # Check if we are supposed to stop early
+            if target_nodes and n_nodes <= target_nodes:
+                stopped_early = True
+                break
+            if time_budget is not None and (time.time() - start) >= time_budget:
+                stopped_early = True
+                break
+
+            # Get the edge that we want to collapse: skip edges that have
+            # already been collapsed or kept and outdated entries
+            while heap:
+                cost, collapse_ix = heapq.heappop(heap)
+                if keep[collapse_ix] or is_collapsed[collapse_ix]:
+                    continue
+                if cost != _heap_key(F_T[collapse_ix]):
+                    continue
+                break
+            else:
+                # No more edges left to collapse
+                break
+
+            if max_cost is not None and cost > max_cost:
+                stopped_early = True
+                break
+
+            # Get the (current) vertices this edge connects
+            u, v = _find(parent, edges[collapse_ix])
+            # Get all edges that connect u and v (in either direction)
+            # Note that uu and vv edges are not part of both sets
+            a, b = sorted((vert_edges[u], vert_edges[v]), key=len)
+            clps_edges = np.array(sorted(e for e in a if e in b), dtype=int)
 
             # Now find find the faces the collapsed edge is part of
-            # Note: splitting this into three conditions is marginally faster than
-            # np.any(np.isin(face_edges, clps_edges), axis=1)
-            uv0 = np.isin(face_edges[:, 0], clps_edges)
-            uv1 = np.isin(face_edges[:, 1], clps_edges)
-            uv2 = np.isin(face_edges[:, 2], clps_edges)
-            has_uv = uv0 | uv1 | uv2
+            has_uv = sorted(set().union(*[edge_faces[e] for e in clps_edges]))
 
             # If these edges do not have adjacent faces anymore
-            if not np.any(has_uv):
+            if not has_uv:
                 # Track this edge as a keeper
                 keep[clps_edges] = True
                 continue
@@ -393,7 +466,11 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
             clps_faces = face_edges[has_uv]
 
             # Remove the collapsed faces
-            face_edges = face_edges[~has_uv]
+            is_alive[has_uv] = False
+            n_alive -= len(has_uv)
+            for f, row in zip(has_uv, clps_faces.tolist()):
+                for e in row:
+                    edge_faces[e].discard(f)
 
             # Track these edges as collapsed
             is_collapsed[clps_edges] = True
@@ -401,77 +478,85 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
             # Get the adjacent edges (i.e. non-uv edges)
             adj_edges = clps_faces[~np.isin(clps_faces, clps_edges)].reshape(clps_faces.shape[0], 2)
 
-            # We have to do some sorting and finding unique edges to make sure
-            # remapping is done correctly further down
-            # NOTE: Not sure we really need this, so leaving it out for now
-            # adj_edges = np.unique(np.sort(adj_edges, axis=1), axis=0)
-
             # We need to keep track of changes to the adjacent faces
             # Basically each face in (i, j, k) will be reduced to one edge
             # which points from u -> v
             # -> replace occurrences of loosing edge with winning edge
-            for win, loose in adj_edges:
-                if fastremap:
-                    face_edges = fastremap.remap(face_edges, {loose: win},
-                                                 preserve_missing_labels=True,
-                                                 in_place=True)
-                else:
-                    face_edges[face_edges == loose] = win
+            for win, loose in adj_edges.tolist():
                 is_collapsed[loose] = True
-
-            # Replace occurrences of first node u with second node v
-            if fastremap:
-                edges = fastremap.remap(edges, {u: v},
-                                        preserve_missing_labels=True,
-                                        in_place=True)
-            else:
-                edges[edges == u] = v
+                if win == loose or not edge_faces[loose]:
+                    continue
+                faces = np.fromiter(edge_faces[loose], dtype=int)
+                rows = face_edges[faces]
+                rows[rows == loose] = win
+                face_edges[faces] = rows
+                # Merge the smaller into the larger set
+                if len(edge_faces[loose]) > len(edge_faces[win]):
+                    edge_faces[loose], edge_faces[win] = edge_faces[win], edge_faces[loose]
+                edge_faces[win] |= edge_faces[loose]
+                edge_faces[loose] = set()
+
+            # Replace first node u with second node v
+            parent[u] = v
+            n_nodes -= 1
+            if len(vert_edges[u]) > len(vert_edges[v]):
+                vert_edges[u], vert_edges[v] = vert_edges[v], vert_edges[u]
+            vert_edges[v] |= vert_edges[u]
+            vert_edges[u] = set()
 
             # Add shape cost of u to shape costs of v
-            Q_array[:, :, v] += Q_array[:, :, u]
+            Q_array[v] += Q_array[u]
 
             # Determine which edges require update of costs:
             # In theory we only need to update costs for edges that are
             # associated with vertices v and u (which now also v)
-            has_v = (edges[:, 0] == v) | (edges[:, 1] == v)
-
-            # Uncomment to temporarily force updating costs for all edges
-            # has_v[:] = True
+            has_v = np.array(sorted(vert_edges[v]), dtype=int)
+            edges_v = _find(parent, edges[has_v])
 
             # Update shape costs
-            this_Q1 = Q_array[:, :, edges[has_v, 0]]
-            this_Q2 = Q_array[:, :, edges[has_v, 1]]
-
-            F1 = np.einsum('ij,kji->ij', p[edges[has_v, 0]], this_Q1)[:, [0, 1]]
-            F2 = np.einsum('ij,kji->ij', p[edges[has_v, 1]], this_Q2)[:, [0, 1]]
-
-            F = np.append(F1, F2, axis=1)
-            new_shape_cost = np.sum(F, axis=1)
+            new_shape_cost = _shape_cost(p[edges_v[:, 0]], p[edges_v[:, 1]],
+                                         Q_array[edges_v[:, 0]],
+                                         Q_array[edges_v[:, 1]])
 
             # Update sum of incoming edge lengths
             # Technically we would have to recalculate lengths of adjacent edges
             # every time but we will take the cheap way out and simply add them up
             verts_lengths[v] += verts_lengths[u]
             # Update sample costs for edges associated with v
-            ik_edge = verts_lengths[edges[has_v, 0]]
+            ik_edge = verts_lengths[edges_v[:, 0]]
             new_sample_cost = edge_lengths[has_v] * (ik_edge - edge_lengths[has_v])
 
             F_T[has_v] = new_shape_cost * shape_weight + new_sample_cost * sample_weight
 
+            # Push updated costs to the queue (skipping edges that are done)
+            todo = ~(keep[has_v] | is_collapsed[has_v])
+            for item in zip(_heap_keys(F_T[has_v][todo]), has_v[todo].tolist()):
+                heapq.heappush(heap, item)
+
     # After the edge collapse, the edges are garbled - I have yet to figure out
     # why and whether that can be prevented. However the vertices in those
     # edges are correct and so we just need to reconstruct their connectivity
     # by extracting a minimum spanning tree over the mesh.
-    corrected_edges = mst_over_mesh(mesh, edges[keep].flatten())
+    # If we stopped early, edges that have neither been kept nor collapsed yet
+    # are also part of the skeleton
+    if stopped_early:
+        keep = keep | ~is_collapsed
+
+    with stage(profiler, 'skeletonize.mst'):
+        corrected_edges = mst_over_mesh(mesh, _find(parent, edges[keep]).flatten())
+
+        if output == 'skeleton':
+            return Skeleton.from_edges(corrected_edges, mesh.vertices)
 
-    # Generate graph
-    G = edges_to_graph(corrected_edges, vertices=mesh.vertices, fix_tree=True, weight=False,
-                       drop_disconnected=True)
+        # Generate graph
+        G = edges_to_graph(corrected_edges, vertices=mesh.vertices, fix_tree=True, weight=False,
+                           drop_disconnected=True)
 
     if output == 'graph':
         return G
 
-    swc = make_swc(G, mesh)
+    with stage(profiler, 'skeletonize.swc'):
+        swc = make_swc(G, mesh)
 
     if output == 'both':
         return (G, swc)
@@ -479,12 +564,77 @@ def by_edge_collapse(mesh, shape_weight=1, sample_weight=0.1, output='swc',
     return swc
 
 
+# Indices of the upper triangle of the (symmetric) 4x4 Q matrices, i.e.
+# Q00, Q01, Q02, Q03, Q11, Q12, Q13, Q22, Q23, Q33
+_Q_TRIU = np.triu_indices(4)
+
+
+def _shape_cost(p1, p2, Q1, Q2):
+    """Calculate shape costs from compact (N, 10) Q matrices.
+
+    For each edge this is the sum of ``p[j] * sum_k(Q[k, j])`` for the first
+    two coordinates ``j`` of the homogeneous coordinates ``p`` and the Qs
+    of both vertices.
+    """
+    F = np.append(p1[:, :2] * _q_colsums(Q1), p2[:, :2] * _q_colsums(Q2), axis=1)
+    return np.sum(F, axis=1)
+
+
+def _q_colsums(Q):
+    """Sums over the first two columns of compact (N, 10) Q matrices."""
+    # Q00 + Q10 + Q20 + Q30 and Q01 + Q11 + Q21 + Q31, respectively
+    return np.stack((Q[:, 0] + Q[:, 1] + Q[:, 2] + Q[:, 3],
+                     Q[:, 1] + Q[:, 4] + Q[:, 5] + Q[:, 6]), axis=1)
+
+
+def _find(parent, x):
+    """Find current labels for ``x`` in union-find ``parent`` array.
+
+    Also compresses the paths for ``x`` along the way.
+    """
+    x = np.asarray(x)
+    root = parent[x]
+    while True:
+        up = parent[root]
+        if np.all(up == root):
+            break
+        root = up
+    parent[x] = root
+    return root
+
+
+def _heap_keys(costs):
+    """Turn array of costs into list of keys for the priority queue.
+
+    NaNs are turned into -inf: this way they come first which is consistent
+    with ``np.argmin``.
+    """
+    keys = np.asarray(costs, dtype=np.float64)
+    keys[np.isnan(keys)] = -np.inf
+    return keys.tolist()
+
+
+def _heap_key(cost):
+    """Turn a single cost into a key for the priority queue."""
+    cost = float(cost)
+    return -np.inf if cost != cost else cost
+
+
 def mst_over_mesh(mesh, verts, limit='auto'):
     """Generate minimum spanning tree by subsetting mesh to given vertices.
 
     Will (re-)connect vertices based on geodesic distance in original mesh
     using a minimum spanning tree.
 
+    To avoid computing distances between all pairs of vertices, we partition
+    the mesh into geodesic Voronoi regions around the vertices to keep (one
+    multi-source Dijkstra) and only consider connections between vertices
+    whose regions are adjacent: the length of such a connection is that of
+    the shortest path across the regions' shared boundary. The minimum
+    spanning tree of this sparse graph is also a minimum spanning tree of
+    the full geodesic distance graph (see Mehlhorn, 1988) but memory is
+    only linear in the size of the mesh.
+
     Parameters
     ----------
     mesh :      trimesh.Trimesh
@@ -493,10 +643,10 @@ def mst_over_mesh(mesh, verts, limit='auto'):
                 Vertex indices to keep for the tree.
     limit :     float | np.inf | "auto"
                 Use this to limit the distance for shortest path search
-                (``scipy.sparse.csgraph.dijkstra``). Can greatly speed up this
+                (``scipy.sparse.csgraph.dijkstra``): vertices further apart
+                than this will not be connected directly. Can speed up this
                 function at the risk of producing disconnected components. By
-                default (auto), we are using 3x the max observed Eucledian
-                distance between ``verts``.
+                default (auto), there is no limit.
 
     Returns
     -------
@@ -520,55 +670,108 @@ def mst_over_mesh(mesh, verts, limit='auto'):
                                   shape=(verts.shape[0], verts.shape[0]))
 
     if limit == 'auto':
-        distances = scipy.spatial.distance.pdist(verts[keep])
-        limit = np.max(distances) * 3
-
-    # Get geodesic distances between vertices
-    dist_matrix = scipy.sparse.csgraph.dijkstra(csgraph=adj, directed=False,
-                                                indices=keep, limit=limit)
-
-    # Subset along second axis
-    dist_matrix = dist_matrix[:, keep]
+        limit = np.inf
+
+    # Get each vertex's distance to (and ID of) the closest vertex to keep
+    # Regions only need to grow half way for vertices within `limit` to meet
+    dist, _, sources = scipy.sparse.csgraph.dijkstra(csgraph=adj, directed=False,
+                                                     indices=keep,
+                                                     min_only=True,
+                                                     limit=limit / 2,
+                                                     return_predecessors=True)
+
+    # Mesh edges that cross from one region into another are candidate
+    # connections between the two regions' vertices
+    src1, src2 = sources[edges[:, 0]], sources[edges[:, 1]]
+    is_cross = (src1 != src2) & (src1 >= 0) & (src2 >= 0)
+
+    # No regions touch (e.g. a single vertex to keep or one per connected
+    # component): there is nothing to connect
+    if not is_cross.any():
+        return np.zeros((0, 2), dtype=int)
+
+    pairs = np.sort(np.searchsorted(keep, np.array([src1[is_cross], src2[is_cross]]).T), axis=1)
+    weights = (dist[edges[is_cross, 0]] + edge_lengths[is_cross]
+               + dist[edges[is_cross, 1]])
+
+    # For each pair of regions only keep the shortest connection
+    srt = np.lexsort((weights, pairs[:, 1], pairs[:, 0]))
+    pairs, weights = pairs[srt], weights[srt]
+    is_first = np.append(True, np.any(pairs[1:] != pairs[:-1], axis=1))
+    is_first &= weights <= limit
+    pairs, weights = pairs[is_first], weights[is_first]
+
+    # The minimum spanning tree ignores zero-weight edges: vertices at the
+    # same position still need to be connected
+    weights = np.maximum(weights, np.finfo(float).tiny)
 
     # Get minimum spanning tree
-    mst = scipy.sparse.csgraph.minimum_spanning_tree(dist_matrix, overwrite=True)
+    sparse = scipy.sparse.coo_matrix((weights, (pairs[:, 0], pairs[:, 1])),
+                                     shape=(len(keep), len(keep)))
+    mst = scipy.sparse.csgraph.minimum_spanning_tree(sparse.tocsr(), overwrite=True)
 
-    # Turn into COO matrix
-    coo = mst.tocoo()
+    # Last but not least we have to turn this into a hierarchical tree, i.e.
+    # make edges are orientated in a way that each node only has a single
+    # parent (turn a<-b->c into a->b->c)
+    parents = _forest_parents(mst)
 
-    # Extract edge list
-    edges = np.array([keep[coo.row], keep[coo.col]]).T
+    # Drop vertices that aren't connected to any other vertex
+    coo = mst.tocoo()
+    is_connected = np.bincount(np.append(coo.row, coo.col),
+                               minlength=len(keep)) > 0
 
-    # Last but not least we have to run a depth first search to turn this
-    # into a hierarchical tree, i.e. make edges are orientated in a way that
-    # each node only has a single parent (turn a<-b->c into a->b->c)
+    # Note that we assign -1 as root's parent
+    nodes = keep[is_connected]
+    parents = parents[is_connected]
+    parents[parents >= 0] = keep[parents[parents >= 0]]
 
-    # Generate and populate undirected graph
-    G = nx.Graph()
-    G.add_edges_from(edges)
+    return np.array([nodes, parents]).T.astype(int)
 
-    # Generate list of parents
-    edges = []
-    # Go over all connected components
-    for c in nx.connected_components(G):
-        # Get subgraph of this connected component
-        SG = nx.subgraph(G, c)
 
-        # Use first node as root
-        r = list(SG.nodes)[0]
+def _forest_parents(forest):
+    """Turn an (undirected) forest into a parent array.
 
-        # List of parents: {node: [parent], root: []}
-        this_lop = nx.predecessor(SG, r)
+    Parameters
+    ----------
+    forest :    scipy.sparse matrix
+                (N, N) adjacency matrix of a graph without cycles, e.g. a
+                minimum spanning tree.
 
-        # Note that we assign -1 as root's parent
-        edges += [(k, v[0] if v else -1) for k, v in this_lop.items()]
+    Returns
+    -------
+    parents :   np.ndarray
+                (N, ) array with the parent of each node. The root of each
+                connected component (its lowest node) has parent -1.
 
-    return np.array(edges).astype(int)
+    """
+    n_nodes = forest.shape[0]
+    if not n_nodes:
+        return np.zeros(0, dtype=int)
+
+    # Pick the first node in each connected component as root
+    _, comp = scipy.sparse.csgraph.connected_components(forest, directed=False)
+    _, roots = np.unique(comp, return_index=True)
+
+    # Connect all roots to an additional, virtual node so that a single
+    # breadth-first search from that node orients all components at once
+    coo = forest.tocoo()
+    rows = np.append(coo.row, np.full(len(roots), n_nodes))
+    cols = np.append(coo.col, roots)
+    aug = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                  shape=(n_nodes + 1, n_nodes + 1))
+    _, pred = scipy.sparse.csgraph.breadth_first_order(aug, n_nodes,
+                                                       directed=False,
+                                                       return_predecessors=True)
+    parents = pred[:n_nodes].astype(int)
+    parents[roots] = -1
+
+    return parents
 
 
 def by_vertex_clusters(mesh, sampling_dist, cluster_pos='median',
-                       output='swc', vertex_map=False,
-                       drop_disconnected=False, progress=True):
+                       clustering='dfs', output='swc', vertex_map=False,
+                       drop_disconnected=False, progress=True, dtype=None,
+                       profiler=None):
     """Skeletonize a contracted mesh by clustering vertices.
 
     Notes
@@ -584,6 +787,11 @@ def by_vertex_clusters(mesh, sampling_dist, cluster_pos='median',
     not very clever and you might have to play around with the parameters
     (mostly ``sampling_dist``) to get decent results.
 
+    Alternatively, ``clustering="geodesic"`` places cluster seeds by
+    farthest-point sampling and assigns each vertex to the geodesically
+    closest seed. This produces more compact (and reproducible) clusters
+    which typically allows for larger ``sampling_dist`` at the same quality.
+
     Parameters
     ----------
     mesh :          mesh obj
@@ -591,10 +799,20 @@ def by_vertex_clusters(mesh, sampling_dist, cluster_pos='median',
                     ``.vertices`` and ``.faces`` properties  (e.g. a
                     trimesh.Trimesh) or a tuple ``(vertices, faces)`` or a
                     dictionary ``{'vertices': vertices, 'faces': faces}``.
-    sampling_dist : float | int
+    sampling_dist : float | int | list thereof
                     Maximal distance at which vertices are clustered. This
                     parameter should be tuned based on the resolution of your
-                    mesh (see Examples).
+                    mesh (see Examples). If a list, will produce one skeleton
+                    per sampling distance (see Returns). Only the finest
+                    level is clustered on the mesh itself: each coarser level
+                    is derived by clustering the clusters of the previous
+                    level (using the distances between their centers), which
+                    is much faster than skeletonizing repeatedly. Vertices
+                    are then within about ``sampling_dist`` plus half the
+                    previous sampling distance of their cluster's start/seed
+                    (instead of ``sampling_dist``). With ``"dfs"``, coarse
+                    levels have fewer nodes than clustering the mesh
+                    directly since the traversal can not overshoot.
     cluster_pos :   "median" | "center"
                     How to determine the x/y/z coordinates of the collapsed
                     vertex clusters (i.e. the skeleton's nodes)::
@@ -603,17 +821,32 @@ def by_vertex_clusters(mesh, sampling_dist, cluster_pos='median',
                         mass.
                       - "center": Use the center of mass. This makes for smoother
                         skeletons but can lead to nodes outside the mesh.
+    clustering :    "dfs" | "geodesic"
+                    How to group vertices into clusters::
+
+                      - "dfs": Depth first traversal that stops once it has
+                        traveled ``sampling_dist``. Fast but clusters depend on
+                        the traversal order and can be irregular.
+                      - "geodesic": Geodesic Voronoi partition around seeds
+                        that are at most ``sampling_dist`` away from any
+                        vertex. See ``geodesic_labels``.
     vertex_map :    bool
                     If True, we will add a "vertex_id" property to the graph and
                     column to the SWC table that maps the cluster ID its first
                     vertex in the original mesh.
-    output :        "swc" | "graph" | "both"
+    output :        "swc" | "graph" | "both" | "skeleton"
                     Determines the function's output. See ``Returns``.
     drop_disconnected : bool
                     If True, will drop disconnected nodes from the skeleton.
                     Note that this might result in empty skeletons.
     progress :      bool
                     If True, will show progress bar.
+    dtype :         "float32" | "float64", optional
+                    Working precision for coordinates, edge lengths and
+                    costs. Defaults to float64.
+    profiler :      callable, optional
+                    If provided, will be called with timing/memory events for
+                    sub-stages. See ``skeletor.profiling``.
 
     Returns
     -------
@@ -623,114 +856,222 @@ def by_vertex_clusters(mesh, sampling_dist, cluster_pos='median',
                     Graph representation of the skeleton.
     "both" :        tuple
                     Both of the above: ``(swc, graph)``.
+    "skeleton" :    skeletor.skeleton.Skeleton
+                    Compact, array-based representation of the skeleton.
+                    Skips generating graph and SWC table and is hence much
+                    faster for large skeletons. Use its ``.to_swc()`` and
+                    ``.to_networkx()`` methods for conversion.
+    list
+                    If ``sampling_dist`` is a list: one of the above for each
+                    sampling distance (in the same order).
 
     """
-    assert output in ['swc', 'graph', 'both']
+    assert output in ['swc', 'graph', 'both', 'skeleton']
     assert cluster_pos in ['center', 'median']
+    assert clustering in ['dfs', 'geodesic']
 
     mesh = make_trimesh(mesh, validate=False)
+    verts = np.asarray(mesh.vertices, dtype=dtype)
 
-    # Produce weighted edges
-    edges = np.concatenate((mesh.edges_unique,
-                            mesh.edges_unique_length.reshape(mesh.edges_unique.shape[0], 1)),
-                           axis=1)
-
-    # Generate Graph (must be undirected)
-    G = nx.Graph()
-    G.add_weighted_edges_from(edges)
-
-    # Run the graph traversal that groups vertices into spatial clusters
-    not_visited = set(G.nodes)
-    seen = set()
-    clusters = []
-    to_visit = len(not_visited)
-    with tqdm(desc='Clustering', total=len(not_visited), disable=progress is False) as pbar:
-        while not_visited:
-            # Pick a random node
-            start = not_visited.pop()
-            # Get all nodes in the geodesic vicinity
-            cl, seen = dfs(G, n=start, dist_traveled=0,
-                           max_dist=sampling_dist, seen=seen)
-            cl = set(cl)
-
-            # Append this cluster and track visited/not-visited nodes
-            clusters.append(cl)
-            not_visited = not_visited - cl
-
-            # Update  progress bar
-            pbar.update(to_visit - len(not_visited))
-            to_visit = len(not_visited)
-
-    # `clusters` is a list of sets -> let's turn it into list of arrays
-    clusters = [np.array(list(c)).astype(int) for c in clusters]
-
-    # Get positions of clusters
-    if cluster_pos == 'center':
-        # Get the center of each cluster
-        cl_coords = np.array([np.mean(mesh.vertices[c], axis=0) for c in clusters])
-    elif cluster_pos == 'median':
-        # Get the node that's closest to to the clusters center
-        cl_coords = []
-        for c in clusters:
-            cnt = np.mean(mesh.vertices[c], axis=0)
-            cnt_dist = np.sum(np.fabs(mesh.vertices[c] - cnt), axis=1)
-            median = mesh.vertices[c][np.argmin(cnt_dist)]
-            cl_coords.append(median)
-        cl_coords = np.array(cl_coords)
-
-    # Generate edges
-    cl_edges = np.array(mesh.edges_unique)
-    if fastremap:
-        mapping = {n: i for i, l in enumerate(clusters) for n in l}
-        cl_edges = fastremap.remap(cl_edges, mapping, preserve_missing_labels=False, in_place=True)
-    else:
-        for i, c in enumerate(clusters):
-            cl_edges[np.isin(cl_edges, c)] = i
-
-    # Remove directionality from cluster edges
-    cl_edges = np.sort(cl_edges, axis=1)
-
-    # Get unique edges
-    cl_edges = np.unique(cl_edges, axis=0)
-
-    # Calculate edge lengths
-    co1 = cl_coords[cl_edges[:, 0]]
-    co2 = cl_coords[cl_edges[:, 1]]
-    cl_edge_lengths = np.sqrt(np.sum((co1 - co2)**2, axis=1))
-
-    # Produce adjacency matrix from edges and edge lengths
-    n_clusters = len(clusters)
-    adj = scipy.sparse.coo_matrix((cl_edge_lengths,
-                                   (cl_edges[:, 0], cl_edges[:, 1])),
-                                  shape=(n_clusters, n_clusters))
+    # Produce (symmetric) adjacency matrix with edge lengths as weights
+    edges = np.asarray(mesh.edges_unique)
+    lengths = np.linalg.norm(verts[edges[:, 0]] - verts[edges[:, 1]], axis=1)
+    adj = scipy.sparse.csr_matrix((np.append(lengths, lengths),
+                                   (edges.T.flatten(), edges[:, ::-1].T.flatten())),
+                                  shape=(verts.shape[0], verts.shape[0]))
 
-    # The cluster graph likely still contain cycles, let's get rid of them using
-    # a minimum spanning tree
-    mst = scipy.sparse.csgraph.minimum_spanning_tree(adj,
-                                                     overwrite=True)
+    def cluster(adj, max_dist, progress, strict=False):
+        if clustering == 'dfs':
+            return dfs_labels(adj.indptr, adj.indices, adj.data,
+                              max_dist=max_dist, strict=strict,
+                              progress=progress)
+        return geodesic_labels(adj, max_dist=max_dist, progress=progress)
+
+    if not isinstance(sampling_dist, (list, tuple, np.ndarray)):
+        # Run the graph traversal that groups vertices into spatial clusters
+        with stage(profiler, 'skeletonize.clustering', clustering=clustering):
+            labels = cluster(adj, sampling_dist, progress)
+            centers, counts = _cluster_centers(verts, labels)
+            cl_edges = _cluster_edges(labels, edges)
+
+        return _clusters_to_skeleton(labels, verts, cl_edges, centers, counts,
+                                     cluster_pos=cluster_pos, output=output,
+                                     vertex_map=vertex_map,
+                                     drop_disconnected=drop_disconnected,
+                                     profiler=profiler)
+
+    # For multiple sampling distances, we cluster the mesh at the finest level
+    # and then derive each coarser level by clustering the clusters of the
+    # previous level: these are placed at their centers and connected if they
+    # are adjacent. Vertices lie up to one previous sampling distance (on
+    # average about half of that) away from their cluster's center, so we
+    # shrink the distance used on this quotient graph by half the previous
+    # sampling distance to stop radii from compounding across levels. For the
+    # same reason, DFS must not add clusters beyond that distance (on the
+    # quotient graph, overshooting by one hop means by a whole cluster).
+    results = {}
+    labels = None
+    prev_sd = 0
+    for sd in sorted(set(sampling_dist)):
+        with stage(profiler, 'skeletonize.clustering', clustering=clustering,
+                   sampling_dist=sd):
+            if labels is None:
+                labels = cluster(adj, sd, progress)
+                centers, counts = _cluster_centers(verts, labels)
+                cl_edges = _cluster_edges(labels, edges)
+            else:
+                # Quotient graph of the previous level without self-loops
+                q_edges = cl_edges[cl_edges[:, 0] != cl_edges[:, 1]]
+                q_lengths = np.linalg.norm(centers[q_edges[:, 0]] - centers[q_edges[:, 1]],
+                                           axis=1)
+                q_adj = scipy.sparse.csr_matrix((np.append(q_lengths, q_lengths),
+                                                 (q_edges.T.flatten(),
+                                                  q_edges[:, ::-1].T.flatten())),
+                                                shape=(len(centers), len(centers)))
+                coarse = cluster(q_adj, sd - prev_sd / 2, False, strict=True)
+
+                # Clusters without neighbours (i.e. isolated pieces of the
+                # mesh) stay on their own
+                isolated = coarse < 0
+                coarse[isolated] = coarse.max() + 1 + np.arange(isolated.sum())
+
+                labels = np.where(labels >= 0, coarse[np.maximum(labels, 0)], -1)
+                centers, counts = _cluster_centers(centers, coarse, weights=counts)
+                cl_edges = _cluster_edges(coarse, cl_edges)
+
+        prev_sd = sd
+        results[sd] = _clusters_to_skeleton(labels, verts, cl_edges, centers,
+                                            counts, cluster_pos=cluster_pos,
+                                            output=output,
+                                            vertex_map=vertex_map,
+                                            drop_disconnected=drop_disconnected,
+                                            profiler=profiler)
+
+    return [results[sd] for sd in sampling_dist]
+
+
+def _cluster_centers(coords, labels, weights=None):
+    """Return center and (weighted) number of points of each cluster."""
+    # Note that vertices without edges are not part of any cluster (label -1)
+    clustered = labels >= 0
+    n_clusters = labels.max() + 1
+    if weights is None:
+        weights = np.ones(len(labels), dtype=int)
+    weights = weights[clustered]
+    counts = np.bincount(labels[clustered], weights=weights, minlength=n_clusters)
+    centers = np.stack([np.bincount(labels[clustered],
+                                    weights=coords[clustered, i] * weights,
+                                    minlength=n_clusters) for i in range(3)],
+                       axis=1) / counts.reshape(-1, 1)
+    return centers.astype(coords.dtype), counts.astype(int)
+
+
+def _cluster_edges(labels, edges):
+    """Return unique, sorted edges between clusters (including self-loops)."""
+    cl_edges = np.sort(labels[edges], axis=1).astype(np.int64)
+    # Unique via single integer key - much faster than `np.unique(axis=0)`
+    n = cl_edges.max() + 1 if len(cl_edges) else 1
+    keys = np.unique(cl_edges[:, 0] * n + cl_edges[:, 1])
+    return np.array([keys // n, keys % n]).T
+
+
+def _clusters_to_skeleton(labels, verts, cl_edges, centers, counts,
+                          cluster_pos, output, vertex_map, drop_disconnected,
+                          profiler=None):
+    """Collapse vertex clusters into skeleton nodes and connect them.
 
-    # Turn into COO matrix
-    coo = mst.tocoo()
+    Parameters
+    ----------
+    labels :        (N, ) array
+                    Cluster label for each vertex (-1 for vertices without
+                    edges).
+    verts :         (N, 3) array
+                    Vertex coordinates.
+    cl_edges :      (M, 2) array
+                    Unique, sorted edges between clusters (see
+                    ``_cluster_edges``).
+    centers :       (K, 3) array
+                    Center of each cluster.
+    counts :        (K, ) array
+                    Number of vertices in each cluster.
+
+    See ``by_vertex_clusters`` for the other parameters.
 
-    # Extract edge list
-    edges = np.array([coo.row, coo.col]).T
+    """
+    # Note that vertices without edges are not part of any cluster (label -1)
+    clustered = np.where(labels >= 0)[0]
+    cl_labels = labels[clustered]
+    n_clusters = labels.max() + 1
 
-    # Produce final graph - this also takes care of some fixing
-    G = edges_to_graph(edges, nodes=np.unique(cl_edges.flatten()),
-                       drop_disconnected=drop_disconnected, fix_tree=True)
+    # Get positions of clusters
+    if cluster_pos == 'center':
+        cl_coords = centers
+    elif cluster_pos == 'median':
+        # Get the node that's closest to to the clusters center: sort vertices
+        # by cluster and then distance and pick the first in each cluster
+        cnt_dist = np.sum(np.fabs(verts[clustered] - centers[cl_labels]), axis=1)
+        srt = np.lexsort((cnt_dist, cl_labels))
+        first = np.cumsum(counts) - counts
+        cl_coords = verts[clustered[srt[first]]]
+
+    with stage(profiler, 'skeletonize.mst'):
+        # Calculate edge lengths
+        co1 = cl_coords[cl_edges[:, 0]]
+        co2 = cl_coords[cl_edges[:, 1]]
+        cl_edge_lengths = np.sqrt(np.sum((co1 - co2)**2, axis=1))
+
+        # Produce adjacency matrix from edges and edge lengths
+        adj = scipy.sparse.coo_matrix((cl_edge_lengths,
+                                       (cl_edges[:, 0], cl_edges[:, 1])),
+                                      shape=(n_clusters, n_clusters))
+
+        # The cluster graph likely still contain cycles, let's get rid of them using
+        # a minimum spanning tree
+        mst = scipy.sparse.csgraph.minimum_spanning_tree(adj,
+                                                         overwrite=True)
+
+        if output != 'skeleton':
+            # Turn into COO matrix
+            coo = mst.tocoo()
+
+            # Extract edge list
+            edges = np.array([coo.row, coo.col]).T
+
+            # Produce final graph - this also takes care of some fixing
+            G = edges_to_graph(edges, nodes=np.unique(cl_edges.flatten()),
+                               drop_disconnected=drop_disconnected, fix_tree=True)
 
     # At this point nodes are labeled by index of the cluster
     # Let's give them a "vertex_id" property mapping back to the
     # first vertex in that cluster
     if vertex_map:
-        mapping = {i: l[0] for i, l in enumerate(clusters)}
+        first_vertex = np.full(n_clusters, verts.shape[0])
+        np.minimum.at(first_vertex, cl_labels, clustered)
+
+    if output == 'skeleton':
+        # Each cluster has at least one edge (possibly to itself), so the
+        # nodes are simply the clusters
+        parents = _forest_parents(mst)
+        node_ids = np.arange(n_clusters)
+        if drop_disconnected:
+            is_connected = (parents >= 0) | (np.bincount(parents[parents >= 0],
+                                                         minlength=n_clusters) > 0)
+            new_ix = np.cumsum(is_connected) - 1
+            parents = np.where(parents >= 0, new_ix[parents], -1)[is_connected]
+            node_ids = node_ids[is_connected]
+        return Skeleton(parents, cl_coords[node_ids], node_ids=node_ids,
+                        vertex_ids=first_vertex[node_ids] if vertex_map else None)
+
+    if vertex_map:
+        mapping = dict(enumerate(first_vertex.tolist()))
         nx.set_node_attributes(G, mapping, name="vertex_id")
 
     if output == 'graph':
         return G
 
     # Generate SWC
-    swc = make_swc(G, cl_coords)
+    with stage(profiler, 'skeletonize.swc'):
+        swc = make_swc(G, cl_coords)
 
     # Add vertex ID column if requested
     if vertex_map:
@@ -758,6 +1099,240 @@ def dfs(G, n, dist_traveled, max_dist, seen):
     return visited, seen
 
 
+def dfs_labels(indptr, indices, data, max_dist, strict=False, progress=False):
+    """Group vertices into clusters by depth first traversal.
+
+    Like ``dfs`` but works directly on a (symmetric) CSR adjacency matrix and
+    uses an explicit stack instead of recursion: starting from the lowest
+    unlabelled vertex, traverses the graph and adds each vertex it reaches
+    to the current cluster. Vertices that are more than ``max_dist`` away
+    (along the path traveled) from the start are still added but the
+    traversal does not continue past them, unless ``strict=True``.
+
+    Parameters
+    ----------
+    indptr, indices, data : np.ndarray
+                    The ``indptr``, ``indices`` and ``data`` (edge lengths)
+                    arrays of the CSR adjacency matrix.
+    max_dist :      float | int
+                    Maximal distance to travel from the start of each cluster.
+    strict :        bool
+                    If True, vertices beyond ``max_dist`` are not added to
+                    the cluster (i.e. are left for the next cluster).
+    progress :      bool
+                    If True, will show progress bar.
+
+    Returns
+    -------
+    labels :        np.ndarray
+                    Cluster label for each vertex. Vertices without any edges
+                    are labelled -1.
+
+    """
+    n_verts = len(indptr) - 1
+    has_edges = np.diff(indptr) > 0
+
+    # Python lists are much faster than arrays for element-wise access
+    indptr = np.asarray(indptr).tolist()
+    indices = np.asarray(indices).tolist()
+    data = np.asarray(data).tolist()
+    labels = [-1] * n_verts
+
+    n_clusters = 0
+    with tqdm(desc='Clustering', total=int(has_edges.sum()),
+              disable=progress is False) as pbar:
+        for start in np.where(has_edges)[0].tolist():
+            if labels[start] >= 0:
+                continue
+
+            label = n_clusters
+            n_clusters += 1
+            labels[start] = label
+            size = 1
+
+            # The stack holds (node, distance traveled, next neighbour)
+            # Nodes beyond max_dist get an exhausted neighbour pointer
+            stack_n = [start]
+            stack_d = [0]
+            stack_p = [indptr[start] if 0 <= max_dist else indptr[start + 1]]
+            while stack_n:
+                p, end = stack_p[-1], indptr[stack_n[-1] + 1]
+                # Skip neighbours that have already been visited (or that
+                # are too far away in strict mode)
+                d = stack_d[-1]
+                while p < end and (labels[indices[p]] >= 0
+                                   or (strict and d + data[p] > max_dist)):
+                    p += 1
+                if p >= end:
+                    stack_n.pop()
+                    stack_d.pop()
+                    stack_p.pop()
+                    continue
+                stack_p[-1] = p + 1
+
+                n = indices[p]
+                dist = d + data[p]
+                labels[n] = label
+                size += 1
+
+                stack_n.append(n)
+                stack_d.append(dist)
+                stack_p.append(indptr[n] if dist <= max_dist else indptr[n + 1])
+
+            pbar.update(size)
+
+    return np.array(labels, dtype=int)
+
+
+def geodesic_labels(adj, max_dist, progress=False):
+    """Group vertices into geodesic Voronoi clusters.
+
+    Seeds are placed by (batched) farthest-point sampling: each connected
+    component starts with a single seed at its vertex farthest from its
+    lowest vertex ID. In each subsequent round, we look at the "front" of
+    vertices that are not yet within ``max_dist`` but within
+    ``1.75 * max_dist`` of a seed. New seeds are picked from the front in
+    order of decreasing distance to the existing seeds, skipping vertices
+    that are already within ``max_dist`` of a new seed. Once all vertices
+    are covered, each vertex is assigned to its (geodesically) closest seed
+    via a multi-source Dijkstra. Hence, no vertex is farther than
+    ``max_dist`` from the seed of its cluster.
+
+    Note that ``dfs_labels`` can overshoot ``max_dist`` by up to one edge.
+    If ``max_dist`` is only a few edge lengths, geodesic clustering will
+    therefore produce more clusters than DFS clustering.
+
+    Parameters
+    ----------
+    adj :           scipy.sparse.csr_matrix
+                    Symmetric adjacency matrix with edge lengths as weights.
+    max_dist :      float | int
+                    Maximal geodesic distance between a vertex and the seed
+                    of its cluster.
+    progress :      bool
+                    If True, will show progress bar.
+
+    Returns
+    -------
+    labels :        np.ndarray
+                    Cluster label for each vertex. Vertices without any edges
+                    are labelled -1.
+
+    """
+    n_verts = adj.shape[0]
+    has_edges = np.diff(adj.indptr) > 0
+
+    if max_dist <= 0:
+        labels = np.full(n_verts, -1)
+        labels[has_edges] = np.arange(has_edges.sum())
+        return labels
+
+    # Seed each connected component at the vertex farthest from its lowest
+    # vertex ID - for e.g. a tube, this puts the first seed at one of its ends
+    _, comp = scipy.sparse.csgraph.connected_components(adj, directed=False)
+    ix = np.where(has_edges)[0]
+    first = np.full(comp.max() + 1, n_verts)
+    np.minimum.at(first, comp[ix], ix)
+    first = first[first < n_verts]
+    far = scipy.sparse.csgraph.dijkstra(adj, directed=False, indices=first,
+                                        min_only=True)
+    srt = np.lexsort((-far[ix], comp[ix]))
+    is_first = np.append(True, comp[ix][srt][1:] != comp[ix][srt][:-1])
+    new_seeds = ix[srt[is_first]].tolist()
+
+    # Distances to the closest seed are grown incrementally: each round only
+    # visits vertices that got closer to a seed, so the cost does not depend
+    # on the number of rounds (i.e. the length of the mesh)
+    indptr, indices = adj.indptr.tolist(), adj.indices.tolist()
+    data = adj.data.tolist()
+    limit = 1.75 * max_dist
+    dist = [np.inf] * n_verts
+    # The front: vertices that are not yet within max_dist but within
+    # `limit` of a seed
+    front = set()
+    n_total = n_todo = int(has_edges.sum())
+    seeds = []
+    with tqdm(desc='Clustering', total=n_total,
+              disable=progress is False) as pbar:
+        while True:
+            # Update distances to the closest seed
+            heap = []
+            for n in new_seeds:
+                if dist[n] > max_dist:
+                    front.discard(n)
+                    n_todo -= 1
+                dist[n] = 0
+                heap.append((0, n))
+            seeds += new_seeds
+            heapq.heapify(heap)
+            while heap:
+                d, n = heapq.heappop(heap)
+                if d > dist[n]:
+                    continue
+                for p in range(indptr[n], indptr[n + 1]):
+                    nd = d + data[p]
+                    m = indices[p]
+                    if nd < dist[m] and nd <= limit:
+                        if dist[m] > max_dist:
+                            if nd <= max_dist:
+                                front.discard(m)
+                                n_todo -= 1
+                            else:
+                                front.add(m)
+                        dist[m] = nd
+                        heapq.heappush(heap, (nd, m))
+
+            pbar.update(n_total - n_todo - pbar.n)
+            if not n_todo:
+                break
+
+            # Every component has a seed, so the front can only be empty if
+            # edges longer than ``max_dist`` skip over it: in that case, use
+            # uncovered vertices next to covered ones instead
+            if not front:
+                is_todo = has_edges & (np.array(dist) > max_dist)
+                covered = (has_edges & ~is_todo).astype(np.float32)
+                front = set(np.where(is_todo & (adj @ covered > 0))[0].tolist())
+
+            # Greedily pick new seeds from the front, farthest from existing
+            # seeds first, skipping front vertices that are already within
+            # ``max_dist`` of a new seed
+            taken = set()
+            new_seeds = []
+            for i in sorted(front, key=lambda x: (-dist[x], x)):
+                if i in taken:
+                    continue
+                new_seeds.append(i)
+
+                # Local Dijkstra (within the front) to mark vertices around
+                # the new seed
+                best = {i: 0}
+                heap = [(0, i)]
+                while heap:
+                    d, n = heapq.heappop(heap)
+                    if d > best[n]:
+                        continue
+                    taken.add(n)
+                    for p in range(indptr[n], indptr[n + 1]):
+                        m = indices[p]
+                        nd = d + data[p]
+                        if (nd <= max_dist and m in front
+                                and nd < best.get(m, np.inf)):
+                            best[m] = nd
+                            heapq.heappush(heap, (nd, m))
+
+    # Assign each vertex to its closest seed
+    _, _, sources = scipy.sparse.csgraph.dijkstra(adj, directed=False,
+                                                  indices=seeds,
+                                                  min_only=True,
+                                                  limit=max_dist,
+                                                  return_predecessors=True)
+    seed_labels = np.full(n_verts, -1)
+    seed_labels[seeds] = np.arange(len(seeds))
+
+    return np.where(sources >= 0, seed_labels[sources], -1)
+
+
 def make_swc(x, coords, reindex=False, validate=True):
     """Generate SWC table.
 
@@ -866,68 +1441,58 @@ def edges_to_graph(edges, nodes=None, vertices=None, fix_tree=True,
     # Make sure we don't have a->b and b<-a edges
     edges = np.unique(np.sort(edges, axis=1), axis=0)
 
-    G = nx.Graph()
-
     # Extract nodes from edges if not explicitly provided
     if isinstance(nodes, type(None)):
         nodes = np.unique(edges.flatten())
 
-    if isinstance(vertices, np.ndarray):
+    has_coords = isinstance(vertices, np.ndarray)
+
+    if fix_tree:
+        # Remove cycles by extracting a minimum spanning tree (by edge length
+        # if we have coordinates) and then make sure this is a DAG, i.e. that
+        # all edges point in the same direction (child -> parent)
+        ids = np.unique(np.append(nodes, edges.flatten())).astype(int)
+        ix = np.searchsorted(ids, edges)
+
+        lengths = np.ones(len(edges))
+        if has_coords:
+            valid = np.all(edges >= 0, axis=1)
+            vec = vertices[edges[valid, 0]] - vertices[edges[valid, 1]]
+            lengths[valid] = np.sqrt(np.sum(vec ** 2, axis=1))
+        # The minimum spanning tree ignores zero-weight edges
+        lengths = np.maximum(lengths, np.finfo(float).tiny)
+
+        adj = scipy.sparse.csr_matrix((lengths, (ix[:, 0], ix[:, 1])),
+                                      shape=(len(ids), len(ids)))
+        mst = scipy.sparse.csgraph.minimum_spanning_tree(adj, overwrite=True)
+        parents = _forest_parents(mst)
+
+        is_child = parents >= 0
+        edges = np.array([ids[is_child], ids[parents[is_child]]]).T
+
+        # We need a directed Graph for this as otherwise the child -> parent
+        # order in the edges might get lost
+        G = nx.DiGraph()
+    else:
+        G = nx.Graph()
+
+    if has_coords:
         coords = vertices[nodes]
         add = [(n, {'x': co[0], 'y': co[1], 'z': co[2]}) for n, co in zip(nodes, coords)]
     else:
         add = nodes
     G.add_nodes_from(add)
 
-    G.add_edges_from([(e[0], e[1]) for e in edges])
-
-    if fix_tree:
-        # First remove cycles
-        while True:
-            try:
-                # Find cycle
-                cycle = nx.find_cycle(G)
-            except nx.exception.NetworkXNoCycle:
-                break
-            except BaseException:
-                raise
-
-            # Sort by degree
-            cycle = sorted(cycle, key=lambda x: G.degree[x[0]])
-
-            # Remove the edge with the lowest degree
-            G.remove_edge(cycle[0][0], cycle[0][1])
-
-        # Now make sure this is a DAG, i.e. that all edges point in the same direction
-        new_edges = []
-        for c in nx.connected_components(G.to_undirected()):
-            sg = nx.subgraph(G, c)
-            # Pick a random root
-            r = list(sg.nodes)[0]
-
-            # Generate parent->child dictionary by graph traversal
-            this_lop = nx.predecessor(sg, r)
-
-            # Note that we assign -1 as root's parent
-            new_edges += [(k, v[0]) for k, v in this_lop.items() if v]
-
-        # We need a directed Graph for this as otherwise the child -> parent
-        # order in the edges might get lost
-        G2 = nx.DiGraph()
-        G2.add_nodes_from(G.nodes)
-        G2.add_edges_from(new_edges)
-        G = G2
+    if weight and has_coords:
+        vec = vertices[edges[:, 0]] - vertices[edges[:, 1]]
+        weights = np.sqrt(np.sum(vec ** 2, axis=1))
+        G.add_weighted_edges_from([(e[0], e[1], w) for e, w in zip(edges.tolist(), weights)])
+    else:
+        G.add_edges_from(edges.tolist())
 
     if drop_disconnected:
         # Array of degrees [[node_id, degree], [....], ...]
         deg = np.array(G.degree)
         G.remove_nodes_from(deg[deg[:, 1] == 0][:, 0])
 
-    if weight and isinstance(vertices, np.ndarray):
-        final_edges = np.array(G.edges)
-        vec = vertices[final_edges[:, 0]] - vertices[final_edges[:, 1]]
-        weights = np.sqrt(np.sum(vec ** 2, axis=1))
-        G.remove_edges_from(list(G.edges))
-        G.add_weighted_edges_from([(e[0], e[1], w) for e, w in zip(final_edges, weights)])
-
     return G
@@ -15,6 +15,8 @@
 #
 #    You should have received a copy of the GNU General Public License
 #    along with this program.
+import itertools
+import os
 import warnings
 
 import numpy as np
@@ -22,6 +24,9 @@ import scipy.sparse as spsp
 import scipy.spatial as spspat
 import trimesh as tm
 
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from tqdm.auto import tqdm
+
 from .preprocessing import fix_mesh
 
 
@@ -200,6 +205,173 @@ def laplacian_cotangent(mesh, normalized=False):
     return W
 
 
+def laplacian_plan(mesh, operator='cotangent', boundary=False):
+    """Precompute the topology-dependent parts of a Laplace operator.
+
+    The sparsity pattern of the Laplacian depends only on the mesh's topology
+    which does not change during e.g. mesh contraction. This function does all
+    the expensive bookkeeping (face adjacency, CSR index arrays, etc.) once so
+    that ``laplacian_from_plan`` only has to (re-)compute the weights from the
+    current vertex positions.
+
+    Parameters
+    ----------
+    mesh :          trimesh.Trimesh
+    operator :      "cotangent" | "umbrella"
+                    Which Laplace operator to plan for. See
+                    ``laplacian_cotangent`` and ``laplacian_umbrella``.
+
+    Returns
+    -------
+    plan :          dict
+
+    """
+    assert operator in ('cotangent', 'umbrella')
+    n = len(mesh.vertices)
+
+    if operator == 'cotangent':
+        # Vertices of edges shared by two faces and the two opposite vertices
+        # (i.e. those not part of the shared edge) for each pair of faces
+        ij = np.asarray(mesh.face_adjacency_edges)
+        opposite = np.asarray(mesh.face_adjacency_unshared)
+
+        if boundary:
+            # Edges with only a single face get a -1 as second opposite vertex
+            faces = np.asarray(mesh.faces)
+            edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+            edges_opp = faces[:, [2, 0, 1]].flatten()
+            _, inv, cnt = np.unique(edges, axis=0,
+                                    return_inverse=True,
+                                    return_counts=True)
+            is_bound = cnt[inv.flatten()] == 1
+            ij = np.concatenate((ij, edges[is_bound]))
+            opposite = np.concatenate((opposite,
+                                       np.stack((edges_opp[is_bound],
+                                                 np.full(is_bound.sum(), -1)),
+                                                axis=1)))
+    else:
+        ij = np.asarray(mesh.edges_unique)
+        opposite = None
+
+    # Stack so that we cover i->j and i<-j plus the diagonal
+    rows = np.concatenate((ij[:, 0], ij[:, 1], np.arange(n)))
+    cols = np.concatenate((ij[:, 1], ij[:, 0], np.arange(n)))
+
+    # Generate the sparsity pattern once - this also sorts indices and merges
+    # duplicate entries (e.g. from non-manifold edges)
+    pattern = spsp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    pattern.sum_duplicates()
+    pattern.sort_indices()
+
+    # Map each (row, col) entry onto its position in the CSR data array
+    nnz_rows = np.repeat(np.arange(n), np.diff(pattern.indptr))
+    keys = nnz_rows.astype(np.int64) * n + pattern.indices
+    pos = np.searchsorted(keys, rows.astype(np.int64) * n + cols)
+
+    return {'operator': operator,
+            'n': n,
+            'ij': ij,
+            'opposite': opposite,
+            'indptr': pattern.indptr,
+            'indices': pattern.indices,
+            'rows': nnz_rows,
+            'pos_offdiag': pos[:-n],
+            'pos_diag': pos[-n:]}
+
+
+def laplacian_from_plan(plan, verts, normalized=False, dtype=None):
+    """Compute Laplace operator for given vertex positions from a plan.
+
+    Produces the same operator as ``laplacian_cotangent`` and
+    ``laplacian_umbrella``, respectively, but only fills in the weights.
+
+    Parameters
+    ----------
+    plan :          dict
+                    As produced by ``laplacian_plan``.
+    verts :         (N, 3) numpy array
+                    Current vertex positions.
+    normalized :    bool
+                    If True will (sort of) normalize the weights. Only
+                    relevant for the cotangent operator.
+    dtype :         numpy dtype, optional
+                    Data type of the returned matrix. Defaults to float64.
+                    Note that weights are always calculated in float64.
+
+    Returns
+    -------
+    CSR sparse matrix
+
+    """
+    n = plan['n']
+    i, j = plan['ij'][:, 0], plan['ij'][:, 1]
+
+    if plan['operator'] == 'cotangent':
+        a = _opposite_angles(verts, i, j, plan['opposite'][:, 0])
+        b = _opposite_angles(verts, i, j, plan['opposite'][:, 1])
+
+        # See laplacian_cotangent for an explanation of what's happening here
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            w = 1 / np.tan(a) + 1 / np.tan(b)
+            w[w == np.inf] = 8165619676597685
+
+        # Boundary edges (see ``boundary`` in laplacian_plan) have only one
+        # opposite angle
+        is_bound = plan['opposite'][:, 1] < 0
+        if is_bound.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                w[is_bound] = 1 / np.tan(a[is_bound])
+            w[w == np.inf] = 8165619676597685
+
+        # Both directions get the same weight
+        w_ij = w_ji = w
+
+        # Diagonal is -w(k)
+        diag = - np.bincount(i, weights=w, minlength=n) \
+            - np.bincount(j, weights=w, minlength=n)
+    else:
+        # Weights are inverse distances normalized per vertex (this is what
+        # trimesh's laplacian_calculation does with equal_weight=False)
+        d = np.subtract(verts[i], verts[j], dtype=np.result_type(verts, np.float64))
+        w = 1 / np.maximum(1e-6, np.linalg.norm(d, axis=1))
+        w_sum = np.bincount(i, weights=w, minlength=n) \
+            + np.bincount(j, weights=w, minlength=n)
+        w_ij = w / w_sum[i]
+        w_ji = w / w_sum[j]
+
+        # Rows sum up to 1 -> set diagonal to -1
+        diag = np.full(n, -1.)
+
+    # Fill data array - bincount takes care of adding up duplicate entries
+    data = np.bincount(plan['pos_offdiag'],
+                       weights=np.concatenate((w_ij, w_ji)),
+                       minlength=len(plan['indices']))
+    data[plan['pos_diag']] += diag
+
+    if normalized and plan['operator'] == 'cotangent':
+        # Row-wise L2 normalization (same as sklearn's normalize)
+        norms = np.sqrt(np.bincount(plan['rows'], weights=data ** 2, minlength=n))
+        norms[norms == 0] = 1
+        data /= norms[plan['rows']]
+
+    if dtype is not None:
+        data = data.astype(dtype, copy=False)
+
+    return spsp.csr_matrix((data, plan['indices'], plan['indptr']), shape=(n, n))
+
+
+def _opposite_angles(verts, i, j, o):
+    """Angles at vertices ``o`` in triangles ``(i, j, o)``."""
+    # Always calculate in (at least) float64: (nearly) degenerate triangles
+    # are common in contracted meshes
+    u = np.subtract(verts[i], verts[o], dtype=np.result_type(verts, np.float64))
+    v = np.subtract(verts[j], verts[o], dtype=u.dtype)
+    return np.arctan2(np.linalg.norm(np.cross(u, v), axis=1),
+                      np.einsum('ij,ij->i', u, v))
+
+
 def _laplacian_cotangent_legacy(mesh, symmetric=False, normalized=False):
     """Original implemenation (kept for reference)."""
     n = len(mesh.vertices)
@@ -280,6 +452,27 @@ def getOneRingAreas(mesh):
     return np.sum(vertex_areas, axis=1)
 
 
+def face_areas(verts, faces):
+    """Return area of each face.
+
+    Same as ``mesh.area_faces`` but works on plain arrays and hence doesn't
+    (re-)populate trimesh's cache.
+    """
+    tris = verts[faces]
+    return np.linalg.norm(np.cross(tris[:, 1] - tris[:, 0],
+                                   tris[:, 2] - tris[:, 0]), axis=1) / 2
+
+
+def one_ring_areas(verts, faces):
+    """Sum of face areas around each vertex.
+
+    Same as ``getOneRingAreas`` but works on plain arrays.
+    """
+    areas = face_areas(verts, faces)
+    return np.bincount(faces.flatten(), weights=np.repeat(areas, 3),
+                       minlength=len(verts))
+
+
 def buildKDTree(mesh):
     return spspat.cKDTree(mesh.vertices)
 
@@ -322,3 +515,87 @@ def edge_in_face(edges, faces):
     has_face[in_bounds.flatten()] = sorted[ind[in_bounds]] == comp[in_bounds]
 
     return has_face
+
+
+def run_jobs(func, jobs, n_jobs=None, total=None, desc=None, progress=True,
+             catch=False):
+    """Run ``func(**kwargs)`` for each job, in parallel if ``n_jobs`` > 1.
+
+    Parameters
+    ----------
+    func :      callable
+                Must be a module-level function so that it can be pickled.
+    jobs :      iterable
+                Iterable of ``(job ID, kwargs)`` tuples. Jobs are consumed
+                lazily, i.e. only a limited number of jobs are held in
+                memory at any given time.
+    n_jobs :    int, optional
+                Number of processes. -1 for all available cores. If ``None``
+                or 1, will run jobs sequentially in the current process.
+    total :     int, optional
+                Total number of jobs (for the progress bar).
+    catch :     bool
+                If True, an exception raised by a job - including failing to
+                send it to a worker process (e.g. because it can not be
+                pickled) - is yielded as that job's result instead of being
+                raised.
+
+    Yields
+    ------
+    (job ID, result)
+                In order of completion.
+
+    """
+    if n_jobs in (-1, 'auto'):
+        n_jobs = os.cpu_count()
+
+    with tqdm(total=total, desc=desc, disable=progress is False) as pbar:
+        if n_jobs in (None, 1):
+            for k, kw in jobs:
+                try:
+                    res = func(**kw)
+                except Exception as e:
+                    if not catch:
+                        raise
+                    res = e
+                yield k, res
+                pbar.update()
+            return
+
+        jobs = iter(jobs)
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {}
+            while True:
+                # Keep the number of jobs in flight at bay
+                failed = []
+                for k, kw in itertools.islice(jobs, 2 * n_jobs - len(futures)):
+                    # Profilers can't report back from other processes
+                    if 'profiler' in kw:
+                        kw = {**kw, 'profiler': None}
+                    try:
+                        futures[executor.submit(func, **kw)] = k
+                    except Exception as e:
+                        if not catch:
+                            raise
+                        failed.append((k, e))
+
+                for k, e in failed:
+                    yield k, e
+                    pbar.update()
+
+                if not futures:
+                    if failed:
+                        continue
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for f in done:
+                    k = futures.pop(f)
+                    try:
+                        res = f.result()
+                    except Exception as e:
+                        if not catch:
+                            raise
+                        res = e
+                    yield k, res
+                    pbar.update()
@@ -0,0 +1,56 @@
+import numpy as np
+import trimesh as tm
+
+import skeletor as sk
+from skeletor.cache import ContractionCache
+
+
+def _cached(mesh, cache, **kwargs):
+    """Contract mesh and return whether the result came from the cache."""
+    prof = sk.profiling.Profiler()
+    cont = sk.contract(mesh, WL0=1, iter_lim=3, cache=cache, progress=False,
+                       profiler=prof, **kwargs)
+    event = [e for e in prof.events if e['stage'] == 'contract'][0]
+    return cont, event['cached']
+
+
+def test_hit_and_miss(tmp_path):
+    mesh = tm.creation.icosphere(3)
+    cache = ContractionCache(tmp_path)
+
+    cont, cached = _cached(mesh, cache)
+    assert not cached and len(cache) == 1
+
+    again, cached = _cached(mesh, cache)
+    assert cached and len(cache) == 1
+    assert np.allclose(again.vertices, cont.vertices)
+
+    # Different parameters or mesh are a miss
+    _, cached = _cached(mesh, cache, SL=4)
+    assert not cached and len(cache) == 2
+    _, cached = _cached(tm.creation.icosphere(2), cache)
+    assert not cached and len(cache) == 3
+
+
+def test_time_lim(tmp_path):
+    mesh = tm.creation.icosphere(3)
+    cache = ContractionCache(tmp_path)
+
+    # Runs cut short by the time limit are not cached...
+    _, cached = _cached(mesh, cache, time_lim=0)
+    assert not cached and len(cache) == 0
+
+    # ... but finished runs are found regardless of the time limit
+    _cached(mesh, cache, time_lim=1000)
+    _, cached = _cached(mesh, cache)
+    assert cached and len(cache) == 1
+
+
+def test_version(tmp_path, monkeypatch):
+    mesh = tm.creation.icosphere(2)
+    cache = ContractionCache(tmp_path)
+    key = cache.key(mesh, SL=2)
+    assert cache.key(mesh, SL=2) == key
+
+    monkeypatch.setattr(sk.cache, '__version__', '0.0.0')
+    assert cache.key(mesh, SL=2) != key
@@ -0,0 +1,92 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+import trimesh as tm
+
+from skeletor.skeletonizers import by_vertex_clusters, dfs_labels, geodesic_labels
+
+
+def _adjacency(mesh):
+    edges = mesh.edges_unique
+    lengths = mesh.edges_unique_length
+    return scipy.sparse.csr_matrix((np.append(lengths, lengths),
+                                    (edges.T.flatten(),
+                                     edges[:, ::-1].T.flatten())),
+                                   shape=(len(mesh.vertices), len(mesh.vertices)))
+
+
+def _tube(radius=3, length=200, step=0.5):
+    """Open tube with a regular grid of edges of roughly ``step`` length."""
+    n_around = int(2 * np.pi * radius / step)
+    n_along = int(length / step) + 1
+    angle = np.arange(n_around) * 2 * np.pi / n_around
+    z = np.linspace(0, length, n_along)
+    verts = np.stack([np.tile(radius * np.cos(angle), n_along),
+                      np.tile(radius * np.sin(angle), n_along),
+                      np.repeat(z, n_around)], axis=1)
+    ring = np.arange(n_around)
+    a = (np.arange(n_along - 1)[:, None] * n_around + ring).flatten()
+    b = (np.arange(n_along - 1)[:, None] * n_around + (ring + 1) % n_around).flatten()
+    faces = np.vstack([np.stack([a, b, b + n_around], axis=1),
+                       np.stack([a, b + n_around, a + n_around], axis=1)])
+    return tm.Trimesh(verts, faces, process=False)
+
+
+def _check_geodesic(mesh, sampling_dist):
+    adj = _adjacency(mesh)
+    geo = geodesic_labels(adj, sampling_dist)
+    dfs = dfs_labels(adj.indptr, adj.indices, adj.data, sampling_dist)
+
+    # Coarser (or equal) sampling than DFS at the same distance
+    assert geo.max() <= dfs.max()
+
+    # Every vertex is within sampling_dist of the seed of its cluster. Voronoi
+    # cells contain the shortest paths to their seed, so it suffices to check
+    # that some vertex of each cluster reaches all others within the cluster
+    assert (geo >= 0).all()
+    for label in np.unique(geo):
+        members = np.where(geo == label)[0]
+        dist = scipy.sparse.csgraph.dijkstra(adj[members][:, members],
+                                             directed=False)
+        assert (dist.max(axis=1) <= sampling_dist).any()
+
+
+def test_geodesic_sphere():
+    # Edges are ~3.8 long, so sampling_dist spans several edges
+    mesh = tm.creation.icosphere(5, radius=100)
+    for sampling_dist in (20, 40):
+        _check_geodesic(mesh, sampling_dist)
+
+
+def test_geodesic_tube():
+    mesh = _tube()
+    for sampling_dist in (2, 4, 8):
+        _check_geodesic(mesh, sampling_dist)
+
+
+def test_multi_resolution():
+    mesh = _tube()
+    adj = _adjacency(mesh)
+    sampling_dist = [2, 4, 8, 16, 32]
+    for clustering in ('dfs', 'geodesic'):
+        skels = by_vertex_clusters(mesh, sampling_dist, clustering=clustering,
+                                   output='skeleton', progress=False)
+        direct = by_vertex_clusters(mesh, sampling_dist[0],
+                                    clustering=clustering,
+                                    output='skeleton', progress=False)
+
+        # The finest level is clustered on the mesh itself
+        assert np.allclose(skels[0].coords, direct.coords)
+
+        # Coarser levels have fewer nodes but still cover the mesh: no vertex
+        # is farther than sampling_dist plus half the previous sampling
+        # distance from a node
+        n_nodes = [s.n_nodes for s in skels]
+        assert n_nodes == sorted(n_nodes, reverse=True)
+        tree = scipy.spatial.cKDTree(mesh.vertices)
+        for prev, sd, skel in zip(sampling_dist, sampling_dist[1:], skels[1:]):
+            ix = tree.query(skel.coords)[1]
+            dist = scipy.sparse.csgraph.dijkstra(adj, directed=False,
+                                                 indices=ix, min_only=True)
+            assert dist.max() <= sd + prev / 2
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+import trimesh as tm
+
+import skeletor as sk
+import skeletor.meshcontraction as mc
+
+
+def _capped_tube(radius=3, length=60, step=1.5):
+    """Closed tube with a regular grid of edges of roughly ``step`` length."""
+    n_around = int(2 * np.pi * radius / step)
+    n_along = int(length / step) + 1
+    angle = np.arange(n_around) * 2 * np.pi / n_around
+    z = np.linspace(0, length, n_along)
+    verts = np.stack([np.tile(radius * np.cos(angle), n_along),
+                      np.tile(radius * np.sin(angle), n_along),
+                      np.repeat(z, n_around)], axis=1)
+    ring = np.arange(n_around)
+    a = (np.arange(n_along - 1)[:, None] * n_around + ring).flatten()
+    b = (np.arange(n_along - 1)[:, None] * n_around + (ring + 1) % n_around).flatten()
+    top = (n_along - 1) * n_around
+    n = len(verts)
+    bottom_cap = np.full(n_around, n), (ring + 1) % n_around, ring
+    top_cap = np.full(n_around, n + 1), top + ring, top + (ring + 1) % n_around
+    faces = np.vstack([np.stack([a, b, b + n_around], axis=1),
+                       np.stack([a, b + n_around, a + n_around], axis=1),
+                       np.stack(bottom_cap, axis=1),
+                       np.stack(top_cap, axis=1)])
+    verts = np.vstack([verts, [[0, 0, 0], [0, 0, length]]])
+    return tm.Trimesh(verts, faces, process=False)
+
+
+@pytest.fixture
+def lsqr_iterations(monkeypatch):
+    """Count the LSQR iterations spent by ``contract``."""
+    counts = []
+    lsqr = mc.lsqr
+
+    def counting_lsqr(*args, **kwargs):
+        res = lsqr(*args, **kwargs)
+        counts.append(res[2])
+        return res
+
+    monkeypatch.setattr(mc, 'lsqr', counting_lsqr)
+    return counts
+
+
+def _contract(mesh, counts, **kwargs):
+    counts.clear()
+    cont = sk.contract(mesh, WL0=1, iter_lim=15, progress=False, **kwargs)
+    return cont.area / mesh.area, sum(counts)
+
+
+def test_warm_start(lsqr_iterations):
+    mesh = _capped_tube()
+    cold_ratio, cold_iter = _contract(mesh, lsqr_iterations)
+    warm_ratio, warm_iter = _contract(mesh, lsqr_iterations, warm_start=True)
+
+    assert cold_ratio < 1e-4
+    assert np.isclose(warm_ratio, cold_ratio, rtol=0.05)
+    assert warm_iter < cold_iter
+
+
+def test_precision_schedule(lsqr_iterations):
+    mesh = _capped_tube()
+    cold_ratio, _ = _contract(mesh, lsqr_iterations)
+    sched_ratio, _ = _contract(mesh, lsqr_iterations, precision=(1e-5, 1e-7))
+
+    # The schedule ends up at the same contraction as the tight precision
+    assert np.isclose(sched_ratio, cold_ratio, rtol=0.05)
+
+    # The last iteration is always solved at the tight precision, even if
+    # epsilon is far off
+    tol = mc._scheduled_precision((1e-4, 1e-7), 0.1, 1e-6, done=1)
+    assert tol == pytest.approx(1e-7)
+    tol = mc._scheduled_precision((1e-4, 1e-7), 1, 1e-6)
+    assert tol == pytest.approx(1e-4)
+
+
+def test_checkpoint_resume(tmp_path):
+    mesh = _capped_tube()
+    path = str(tmp_path / 'contraction.npz')
+    kwargs = dict(WL0=1, progress=False)
+
+    # Stopping at iter_lim does not complete the checkpoint...
+    sk.contract(mesh, iter_lim=3, checkpoint=path, **kwargs)
+    state = mc.load_checkpoint(path, mesh=mesh)
+    assert state['iteration'] == 3 and not state['done']
+
+    # ... so resuming with a higher iter_lim picks up where we left off
+    resumed = sk.contract(mesh, iter_lim=6, checkpoint=path, resume=True,
+                          **kwargs)
+    direct = sk.contract(mesh, iter_lim=6, **kwargs)
+    assert np.allclose(resumed.vertices, direct.vertices)
+
+    # Reaching epsilon completes it
+    sk.contract(mesh, iter_lim=6, epsilon=0.5, checkpoint=path, **kwargs)
+    state = mc.load_checkpoint(path, mesh=mesh)
+    assert state['done'] and state['area_ratios'][-1] <= 0.5
+    done = sk.contract(mesh, iter_lim=10, epsilon=0.5, checkpoint=path,
+                       resume=True, **kwargs)
+    assert np.allclose(done.vertices, state['V'])
+
+
+def test_checkpoint_mismatch(tmp_path):
+    mesh = _capped_tube()
+    path = str(tmp_path / 'contraction.npz')
+    sk.contract(mesh, WL0=1, iter_lim=2, checkpoint=path, progress=False)
+
+    for kwargs in (dict(SL=4), dict(WH0=2), dict(operator='umbrella'),
+                   dict(precision=1e-5), dict(epsilon=1e-3)):
+        with pytest.raises(ValueError, match='different'):
+            sk.contract(mesh, WL0=1, iter_lim=4, checkpoint=path, resume=True,
+                        progress=False, **kwargs)
+
+    with pytest.raises(ValueError, match='different mesh'):
+        sk.contract(_capped_tube(step=2), WL0=1, iter_lim=4, checkpoint=path,
+                    resume=True, progress=False)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import trimesh as tm
+
+from skeletor.pipeline import write_swc
+from skeletor.skeleton import Skeleton
+from skeletor.skeletonizers import by_vertex_clusters
+
+
+def _read_swc(filepath):
+    return pd.read_csv(filepath, sep=' ', comment='#', header=None,
+                       names=['node_id', 'label', 'x', 'y', 'z', 'radius',
+                              'parent_id'])
+
+
+def _from_swc(swc):
+    """Turn SWC table back into a Skeleton."""
+    coords = np.zeros((swc.node_id.max() + 1, 3))
+    coords[swc.node_id.values] = swc[['x', 'y', 'z']].values
+    radius = np.zeros(len(coords))
+    radius[swc.node_id.values] = swc.radius.values
+    skel = Skeleton.from_edges(swc[['node_id', 'parent_id']].values, coords)
+    skel.radius = radius[skel.node_ids]
+    return skel
+
+
+def _check_same(a, b):
+    """Check that two skeletons are the same up to the order of the nodes."""
+    assert a.n_nodes == b.n_nodes
+    ix = np.argsort(a.node_ids)
+    iy = np.argsort(b.node_ids)
+    assert np.array_equal(a.node_ids[ix], b.node_ids[iy])
+    assert np.allclose(a.coords[ix], b.coords[iy])
+    assert np.allclose(a.radius[ix], b.radius[iy])
+
+    # Parents by ID
+    pa = np.where(a.parents >= 0, a.node_ids[a.parents], -1)
+    pb = np.where(b.parents >= 0, b.node_ids[b.parents], -1)
+    assert np.array_equal(pa[ix], pb[iy])
+
+
+def test_swc_round_trip(tmp_path):
+    # Two trees with non-consecutive node IDs
+    skel = Skeleton([-1, 0, 0, 1, -1, 4],
+                    np.arange(18, dtype=float).reshape(6, 3),
+                    radius=[1, 2, 3, 4, 5, 6],
+                    node_ids=[10, 3, 7, 20, 5, 11])
+
+    swc = skel.to_swc()
+    assert swc.parent_id.tolist()[:2] == [-1, -1]
+    _check_same(_from_swc(swc), skel)
+
+    f = tmp_path / 'skeleton.swc'
+    write_swc(swc, f)
+    _check_same(_from_swc(_read_swc(f)), skel)
+
+
+def test_skeletonize_round_trip(tmp_path):
+    mesh = tm.creation.icosphere(3, radius=100)
+    skel = by_vertex_clusters(mesh, 20, output='skeleton', progress=False)
+    swc = by_vertex_clusters(mesh, 20, output='swc', progress=False)
+
+    # The skeleton produces the same table as asking for the SWC directly
+    # (nodes with the same parent may come in any order)
+    pd.testing.assert_frame_equal(
+        skel.to_swc().sort_values('node_id').reset_index(drop=True),
+        swc.sort_values('node_id').reset_index(drop=True))
+
+    f = tmp_path / 'skeleton.swc'
+    write_swc(swc, f)
+    read = _from_swc(_read_swc(f))
+    skel.radius = np.zeros(skel.n_nodes)
+    _check_same(read, skel)
@@ -0,0 +1,38 @@
+import numpy as np
+import trimesh as tm
+
+from skeletor.skeletonizers import mst_over_mesh
+
+
+def _two_spheres():
+    a = tm.creation.icosphere(2, radius=10)
+    return tm.Trimesh(np.vstack([a.vertices, a.vertices + [50, 0, 0]]),
+                      np.vstack([a.faces, a.faces + len(a.vertices)]),
+                      process=False)
+
+
+def test_mst_over_mesh_tree():
+    mesh = tm.creation.icosphere(2, radius=10)
+    keep = np.arange(0, len(mesh.vertices), 10)
+    edges = mst_over_mesh(mesh, keep)
+
+    # A single tree: one root and every other kept vertex has a parent
+    assert sorted(edges[:, 0]) == sorted(keep)
+    assert (edges[:, 1] == -1).sum() == 1
+    assert np.isin(edges[edges[:, 1] >= 0, 1], keep).all()
+
+
+def test_mst_over_mesh_single_vertex():
+    mesh = tm.creation.icosphere(2, radius=10)
+    assert mst_over_mesh(mesh, [0]).shape == (0, 2)
+
+
+def test_mst_over_mesh_disconnected():
+    mesh = _two_spheres()
+    # One vertex per component: nothing to connect
+    assert mst_over_mesh(mesh, [0, 162]).shape == (0, 2)
+
+    # Several vertices per component: one tree per component
+    edges = mst_over_mesh(mesh, [0, 1, 2, 162, 163, 164])
+    assert len(edges) == 6
+    assert (edges[:, 1] == -1).sum() == 2